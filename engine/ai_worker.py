@@ -1,16 +1,24 @@
 import torch, cv2, os, re, threading
 import torch.nn.functional as F
+import numpy as np
 from PIL import Image
 from PySide6.QtCore import QThread, Signal
 from transformers import BlipProcessor, BlipForConditionalGeneration, BlipForImageTextRetrieval
+from engine.vector_store import VectorStoreWriter
+from engine.captioning import generation_kwargs, generate_captions, encode_texts, encode_images, CAPTION_BATCH
+from engine.scheduler import WorkStealingPool, default_workers
+from engine.optimize import optimize_engine, configure_threads
+from engine.clustering import cluster_store, load_clusters
+from engine.processor import load_image_for_model, frame_to_model_rgb, PixelBuffer, file_signature
+from engine.indexer import FRAME_STEP_SEC
 
-_GLOBAL_ENGINE = {"processor": None, "model_gen": None, "model_ret": None}
+_GLOBAL_ENGINE = {"processor": None, "model_gen": None, "model_ret": None, "optimized": None}
 _ENGINE_LOCK = threading.Lock() 
 
 MODEL_PATH = os.path.join(os.getcwd(), "ai_models")
 
-def get_engine_safe(device_string):
-    """Thread-safe global loader for the BLIP models."""
+def get_engine_safe(device_string, optimized=False):
+    """Thread-safe global loader for the BLIP models. optimized=True compiles + warms them up once."""
     global _GLOBAL_ENGINE
     with _ENGINE_LOCK: 
         if _GLOBAL_ENGINE["processor"] is None:
@@ -21,22 +29,90 @@ def get_engine_safe(device_string):
             _GLOBAL_ENGINE["model_ret"] = BlipForImageTextRetrieval.from_pretrained("Salesforce/blip-itm-base-coco", cache_dir=MODEL_PATH).to(dev)
             
             print(f"[AI] ENGINES READY ON {str(dev).upper()}")
+        if optimized and _GLOBAL_ENGINE["optimized"] is None:
+            report = optimize_engine(_GLOBAL_ENGINE["processor"], _GLOBAL_ENGINE["model_gen"], _GLOBAL_ENGINE["model_ret"], torch.device(device_string))
+            _GLOBAL_ENGINE["optimized"] = report
+            if report['mode'] == "eager": print("[AI] OPTIMIZATION FAILED, RUNNING EAGER MODELS")
+            else: print(f"[AI] OPTIMIZED ENGINE ({report['mode']}, {report['threads']} threads): {report['eager_ms']:.1f} ms -> {report['optimized_ms']:.1f} ms per item")
     return _GLOBAL_ENGINE["processor"], _GLOBAL_ENGINE["model_gen"], _GLOBAL_ENGINE["model_ret"]
 
+STOPWORDS = {'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'in', 'on', 'at', 'of', 'and', 'or', 'but', 'with', 'to', 'for', 'from', 'by', 'it', 'this', 'that', 'these', 'those', 'there'}
+
+def clean_words(text):
+    raw = re.findall(r'\w+', text.lower())
+    return [w for w in raw if w not in STOPWORDS]
+
+def combine_keyword_scores(text_score, visual_score):
+    """Keyword-mode score curve. Works on floats and on numpy arrays."""
+    text_score = np.asarray(text_score, dtype=np.float32)
+    partial = np.where(text_score > 0.5, (text_score * 0.9) + (visual_score * 0.1), text_score * 0.5)
+    return np.where(text_score >= 1.0, 1.0, partial)
+
+def combine_vector_scores(text_sim, visual_sim):
+    """Vector-mode score curve. Works on floats and on numpy score matrices."""
+    final = np.asarray(text_sim * 0.7 + visual_sim * 0.3, dtype=np.float32)
+    return np.where(final > 0.15, np.minimum(0.99, np.maximum(0.0, final) ** 2 * 1.3), final)
+
+def engine_report():
+    """Before/after latency of the optimized engine, or None if it runs in eager mode."""
+    report = _GLOBAL_ENGINE["optimized"]
+    return report if report and report['mode'] != "eager" else None
+
 class ModelLoader(QThread):
     finished = Signal()
-    def __init__(self):
+    def __init__(self, optimized=False):
         super().__init__()
         self.target_dev = "cuda" if torch.cuda.is_available() else "cpu"
+        self.optimized = optimized
+        self.error = None
 
     def run(self):
         try:
-            get_engine_safe(self.target_dev)
+            get_engine_safe(self.target_dev, self.optimized)
         except Exception as e:
             print(f"[LOADER ERROR]: {e}")
+            self.error = str(e)
         finally:
             self.finished.emit()
 
+class QueryEncoder(QThread):
+    """Encodes a single query text off the GUI thread (used by live search)."""
+    encoded = Signal(str, object)
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    def run(self):
+        try:
+            proc, _, model_ret = get_engine_safe(self.device)
+            inputs = proc(text=self.text, return_tensors="pt", padding=True).to(self.device)
+            with torch.no_grad():
+                vec = F.normalize(model_ret.text_proj(model_ret.text_encoder(**inputs).last_hidden_state[:, 0, :]), p=2, dim=-1)
+            self.encoded.emit(self.text, vec[0].cpu().numpy())
+        except Exception as e:
+            print(f"[QUERY ENCODER ERROR]: {e}")
+
+class ClusterWorker(QThread):
+    """Runs the similarity clustering job over the stored vision embeddings, or reuses a still-valid clusters.json."""
+    clusters_ready = Signal(object)
+
+    def __init__(self, store_dir, threshold=0.9, paths=None):
+        super().__init__()
+        self.store_dir = store_dir
+        self.threshold = threshold
+        self.paths = paths
+
+    def run(self):
+        try:
+            report = load_clusters(self.store_dir, self.threshold, self.paths)
+            if report: report['cached'] = True
+            self.clusters_ready.emit(report or cluster_store(self.store_dir, self.threshold, self.paths))
+        except Exception as e:
+            print(f"[CLUSTER ERROR]: {e}")
+            self.clusters_ready.emit(None)
+
 class AIWorker(QThread):
     progress_update = Signal(int, str)
     result_found = Signal(dict)
@@ -55,10 +131,23 @@ class AIWorker(QThread):
         self.query_text_vec = None
         self.visual_query_vec = None
 
+        self.num_workers = self.settings.get('workers', default_workers())
+        self.chunk_sec = self.settings.get('chunk_sec', 30)
+        self.batch_size = self.settings.get('batch_size', CAPTION_BATCH)
+        self._merge_lock = threading.Lock()
+        self._video_state = {}
+        self._thread_buffers = threading.local()
+        self.pool = WorkStealingPool(self.num_workers)
+
+        store_dir = self.settings.get('store_dir')
+        self.store = VectorStoreWriter(store_dir, self.settings.get('store_format', 'f16')) if store_dir else None
+
+    def stop(self):
+        """Cancels the scan: queued tasks are dropped, running video chunks stop at the next frame."""
+        self.pool.stop_requested = True
+
     def get_clean_words(self, text):
-        stopwords = {'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'in', 'on', 'at', 'of', 'and', 'or', 'but', 'with', 'to', 'for', 'from', 'by', 'it', 'this', 'that', 'these', 'those', 'there'}
-        raw = re.findall(r'\w+', text.lower())
-        return [w for w in raw if w not in stopwords]
+        return clean_words(text)
 
     def calculate_strict_keyword_score(self, target_caption, visual_score):
         if not self.query_words: return visual_score
@@ -66,25 +155,52 @@ class AIWorker(QThread):
         matches = sum(1 for w in self.query_words if w in target_words_set)
         total = len(self.query_words)
         if total == 0: return visual_score
-        text_score = matches / total
-        if text_score >= 1.0: return 1.0
-        return (text_score * 0.9) + (visual_score * 0.1) if text_score > 0.5 else text_score * 0.5
+        return float(combine_keyword_scores(matches / total, visual_score))
+
+    def encode_text(self, text, proc, model_ret, device):
+        inputs = proc(text=text, return_tensors="pt", padding=True).to(device)
+        with torch.no_grad():
+            return F.normalize(model_ret.text_proj(model_ret.text_encoder(**inputs).last_hidden_state[:, 0, :]), p=2, dim=-1)
 
-    def calculate_vector_score(self, target_caption, target_visual_vec, proc, model_ret, device):
-        inputs = proc(text=target_caption, return_tensors="pt", padding=True).to(device)
+    def encode_image(self, pixel_values, model_ret):
         with torch.no_grad():
-            text_outputs = model_ret.text_encoder(**inputs)
-            target_cap_vec = model_ret.text_proj(text_outputs.last_hidden_state[:, 0, :])
-            target_cap_vec = F.normalize(target_cap_vec, p=2, dim=-1)
+            return F.normalize(model_ret.vision_proj(model_ret.vision_model(pixel_values).last_hidden_state[:, 0, :]), p=2, dim=-1)
+
+    def calculate_vector_score(self, target_cap_vec, target_visual_vec):
         text_sim = F.cosine_similarity(self.query_text_vec, target_cap_vec).item() if self.query_text_vec is not None else 0.0
         visual_sim = F.cosine_similarity(self.visual_query_vec, target_visual_vec).item()
-        final = (text_sim * 0.7) + (visual_sim * 0.3)
-        return min(0.99, (max(0.0, final) ** 2) * 1.3) if final > 0.15 else final
+        return float(combine_vector_scores(text_sim, visual_sim))
+
+    def score_batch(self, items, pixel_values, proc, model_gen, model_ret, device, rows=None):
+        """
+        Captions, embeds and scores a batch of images/frames with one generate() call,
+        records the vectors in the index if one is attached, and fills in item['caption'] / item['score'].
+        With rows given, index entries are collected there instead of being written right away.
+        """
+        preset = self.settings.get('preset', 'quality')
+        target_vecs = encode_images(pixel_values, model_ret)
+        caps = generate_captions(model_gen, pixel_values, proc, preset, self.settings, len(items))
+        cap_vecs = encode_texts(caps, proc, model_ret, device) if (self.mode == 'vector' or self.store) else None
+        for i, (item, cap) in enumerate(zip(items, caps)):
+            item['caption'] = cap
+            if self.store:
+                row = (dict(item, preset=preset), target_vecs[i].cpu().numpy(), cap_vecs[i].cpu().numpy())
+                if rows is None: self.store.add(*row)
+                else: rows.append(row)
+            if self.mode == 'keyword': item['score'] = self.calculate_strict_keyword_score(cap, 0.0)
+            else: item['score'] = self.calculate_vector_score(cap_vecs[i:i + 1].to(device), target_vecs[i:i + 1])
+        return items
+
+    def pixel_buffer(self, proc, device):
+        """Per-thread reusable input tensor with room for one batch (pool threads must not share one)."""
+        buf = getattr(self._thread_buffers, 'buf', None)
+        if buf is None:
+            buf = self._thread_buffers.buf = PixelBuffer(proc, self.batch_size, device)
+        return buf
 
     def generate_caption(self, model, inputs, proc, is_video=False):
-        num_beams = self.settings.get('num_beams', 5)
-        min_length = self.settings.get('min_length', 20)
-        out = model.generate(**inputs, max_new_tokens=60, min_length=min_length, num_beams=num_beams, repetition_penalty=1.2)
+        kwargs = generation_kwargs(self.settings.get('preset', 'quality'), self.settings)
+        out = model.generate(**inputs, **kwargs)
         return proc.decode(out[0], skip_special_tokens=True)
 
     def run(self):
@@ -99,58 +215,120 @@ class AIWorker(QThread):
                     with torch.no_grad():
                         caption = self.generate_caption(model_gen, inputs, proc)
                         self.progress_update.emit(100, caption)
-                        t_inputs = proc(text=caption, return_tensors="pt", padding=True).to(device)
-                        self.query_text_vec = F.normalize(model_ret.text_proj(model_ret.text_encoder(**t_inputs).last_hidden_state[:, 0, :]), p=2, dim=-1)
-                        self.visual_query_vec = F.normalize(model_ret.vision_proj(model_ret.vision_model(inputs.pixel_values).last_hidden_state[:, 0, :]), p=2, dim=-1)
+                        self.query_text_vec = self.encode_text(caption, proc, model_ret, device)
+                        self.visual_query_vec = self.encode_image(inputs.pixel_values, model_ret)
                 elif self.query_text:
-                    t_inputs = proc(text=self.query_text, return_tensors="pt", padding=True).to(device)
-                    with torch.no_grad():
-                        self.query_text_vec = F.normalize(model_ret.text_proj(model_ret.text_encoder(**t_inputs).last_hidden_state[:, 0, :]), p=2, dim=-1)
-                        self.visual_query_vec = self.query_text_vec
+                    self.query_text_vec = self.encode_text(self.query_text, proc, model_ret, device)
+                    self.visual_query_vec = self.query_text_vec
             else:
                 if self.query_text: self.query_words = self.get_clean_words(self.query_text)
 
-            for i, path in enumerate(self.target_paths):
-                self.progress_update.emit(int((i/len(self.target_paths))*100), os.path.basename(path))
-                if path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-                    self.process_vid(path, model_gen, model_ret, proc, device)
-                else:
-                    self.process_img(path, model_gen, model_ret, proc, device)
+            tasks = self.plan_tasks()
+            done = [0]
+            def run_task(task):
+                with self._merge_lock:
+                    first = task[1] if task[0] == 'vid' else task[1][0]
+                    self.progress_update.emit(int((done[0]/len(tasks))*100), os.path.basename(first))
+                if task[0] == 'vid': self.process_vid_chunk(*task[1:], model_gen, model_ret, proc, device)
+                else: self.process_imgs(task[1], model_gen, model_ret, proc, device)
+                with self._merge_lock: done[0] += 1
+
+            configure_threads(self.num_workers)
+            self.pool.run(tasks, run_task)
+            if self.pool.stop_requested:
+                # Videos cut short by a stop still report their best frame so far.
+                for state in self._video_state.values():
+                    if state['pending'] and state['best']: self.result_found.emit(state['best'])
         except Exception as e:
             print(f"[AI WORKER ERROR]: {e}")
         finally:
+            if self.store:
+                try: self.store.close()
+                except Exception as e: print(f"[INDEX ERROR]: {e}")
             self.finished.emit()
 
-    def process_img(self, path, model_gen, model_ret, proc, device):
-        try:
-            img = Image.open(path).convert('RGB')
-            inputs = proc(images=img, return_tensors="pt").to(device)
-            with torch.no_grad():
-                cap = self.generate_caption(model_gen, inputs, proc)
-                target_vec = F.normalize(model_ret.vision_proj(model_ret.vision_model(inputs.pixel_values).last_hidden_state[:, 0, :]), p=2, dim=-1)
-                score = self.calculate_strict_keyword_score(cap, 0.0) if self.mode == 'keyword' else self.calculate_vector_score(cap, target_vec, proc, model_ret, device)
-                self.result_found.emit({'path': path, 'score': score, 'caption': cap})
-        except: pass
+    def process_imgs(self, paths, model_gen, model_ret, proc, device):
+        """Decodes up to batch_size images into the thread's buffer and scores them in one batch."""
+        buf = self.pixel_buffer(proc, device)
+        items = []
+        for path in paths:
+            try:
+                sig = file_signature(path)
+                buf.fill(len(items), load_image_for_model(path, buf.size))
+            except Exception as e:
+                print(f"[AI WORKER] skipping {os.path.basename(path)}: {e}")
+                continue
+            items.append({'path': path, **sig})
+        if not items: return
+        with torch.no_grad():
+            for item in self.score_batch(items, buf.pixel_values(len(items)), proc, model_gen, model_ret, device):
+                self.result_found.emit(item)
+
+    def plan_tasks(self):
+        """
+        Splits the targets into (cost, task) pairs: one task per batch_size images and one per
+        chunk_sec time range of each video, so long videos spread over all workers.
+        """
+        tasks, images = [], []
+        for path in self.target_paths:
+            if not path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
+                images.append(path)
+                continue
+            cap_vid = cv2.VideoCapture(path)
+            fps = cap_vid.get(cv2.CAP_PROP_FPS) or 30
+            total = int(cap_vid.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap_vid.release()
+            frames = list(range(0, total, int(fps * FRAME_STEP_SEC)))
+            per_chunk = max(1, int(self.chunk_sec // FRAME_STEP_SEC))
+            chunks = [frames[s:s + per_chunk] for s in range(0, len(frames), per_chunk)]
+            if not chunks: continue
+            self._video_state[path] = {'pending': len(chunks), 'best': None, 'rows': [], 'complete': True}
+            tasks.extend((len(c), ('vid', path, c, fps)) for c in chunks)
+        for s in range(0, len(images), self.batch_size):
+            batch = images[s:s + self.batch_size]
+            tasks.append((len(batch), ('imgs', batch)))
+        return tasks
 
-    def process_vid(self, path, model_gen, model_ret, proc, device):
+    def process_vid_chunk(self, path, frame_indices, fps, model_gen, model_ret, proc, device):
+        """
+        Decodes one time range with its own capture handle, scores its frames batch_size at a time
+        and merges its best frame into the video's result. Index rows are held back until every
+        chunk of the video has finished, so a stopped scan never records a partly indexed video as fresh.
+        """
         cap_vid = cv2.VideoCapture(path)
-        fps = cap_vid.get(cv2.CAP_PROP_FPS) or 30
-        total = int(cap_vid.get(cv2.CAP_PROP_FRAME_COUNT))
-        best_score, best_data = -1.0, None
-        step = int(fps * 2) 
-
-        for f_idx in range(0, total, step):
-            cap_vid.set(cv2.CAP_PROP_POS_FRAMES, f_idx)
-            ret, frame = cap_vid.read()
-            if not ret: break
-            pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            inputs = proc(images=pil, return_tensors="pt").to(device)
+        buf = self.pixel_buffer(proc, device)
+        best_data, batch, rows, complete = None, [], [], False
+
+        def flush():
+            nonlocal best_data
             with torch.no_grad():
-                target_vec = F.normalize(model_ret.vision_proj(model_ret.vision_model(inputs.pixel_values).last_hidden_state[:, 0, :]), p=2, dim=-1)
-                cap = self.generate_caption(model_gen, inputs, proc, is_video=True)
-                score = self.calculate_strict_keyword_score(cap, 0.0) if self.mode == 'keyword' else self.calculate_vector_score(cap, target_vec, proc, model_ret, device)
-                if score > best_score:
-                    best_score = score
-                    best_data = {'path': path, 'score': score, 'caption': cap, 'timestamp': f"{int(f_idx/fps//60)}:{int(f_idx/fps%60):02d}"}
-        if best_data: self.result_found.emit(best_data)
-        cap_vid.release()
\ No newline at end of file
+                for item in self.score_batch(batch, buf.pixel_values(len(batch)), proc, model_gen, model_ret, device, rows):
+                    if best_data is None or item['score'] > best_data['score']: best_data = item
+            batch.clear()
+
+        try:
+            sig = file_signature(path)
+            for f_idx in frame_indices:
+                if self.pool.stop_requested: break
+                cap_vid.set(cv2.CAP_PROP_POS_FRAMES, f_idx)
+                ret, frame = cap_vid.read()
+                if not ret: break
+                buf.fill(len(batch), frame_to_model_rgb(frame, buf.size))
+                batch.append({'path': path, 'timestamp': f"{int(f_idx/fps//60)}:{int(f_idx/fps%60):02d}", **sig})
+                if len(batch) >= self.batch_size: flush()
+            if batch: flush()
+            complete = not self.pool.stop_requested
+        finally:
+            cap_vid.release()
+            with self._merge_lock:
+                state = self._video_state[path]
+                if best_data and (state['best'] is None or best_data['score'] > state['best']['score']):
+                    state['best'] = best_data
+                state['rows'].extend(rows)
+                state['complete'] = state['complete'] and complete
+                state['pending'] -= 1
+                if state['pending'] == 0:
+                    if state['best']: self.result_found.emit(state['best'])
+                    if self.store and state['complete']:
+                        for row in state['rows']: self.store.add(*row)
+                    state['rows'] = []
@@ -0,0 +1,145 @@
+import os, csv, json, argparse
+import numpy as np
+import torch
+from PIL import Image
+
+from engine.ai_worker import get_engine_safe, combine_vector_scores
+from engine.captioning import generate_captions, encode_texts, encode_images
+from engine.indexer import embed_with_store
+from engine.processor import collect_all_media, IMG_EXTS
+from engine.vector_store import VectorStore, VectorStoreWriter, INDEX_PATH
+
+def is_image_query(query):
+    return os.path.isfile(query) and query.lower().endswith(IMG_EXTS)
+
+def encode_queries(queries, proc, model_gen, model_ret, device, settings=None):
+    """
+    Encodes every query in one forward pass per modality.
+    Returns (text_vecs, visual_vecs) as (num_queries, dim) arrays.
+    Like AIWorker, text queries use their text vector on both sides and image queries are captioned.
+    """
+    settings = settings or {}
+    img_idx = [i for i, q in enumerate(queries) if is_image_query(q)]
+    txt_idx = [i for i, q in enumerate(queries) if not is_image_query(q)]
+    dim = model_ret.config.image_text_hidden_size
+    text_vecs = np.zeros((len(queries), dim), np.float32)
+    visual_vecs = np.zeros((len(queries), dim), np.float32)
+
+    if txt_idx:
+        vecs = encode_texts([queries[i] for i in txt_idx], proc, model_ret, device, batch_size=len(txt_idx)).cpu().numpy()
+        text_vecs[txt_idx] = vecs
+        visual_vecs[txt_idx] = vecs
+    if img_idx:
+        images = [Image.open(queries[i]).convert('RGB') for i in img_idx]
+        pixel_values = proc(images=images, return_tensors="pt").pixel_values.to(device)
+        visual_vecs[img_idx] = encode_images(pixel_values, model_ret).cpu().numpy()
+        captions = generate_captions(model_gen, pixel_values, proc, settings.get('preset', 'quality'), settings, batch_size=len(img_idx))
+        text_vecs[img_idx] = encode_texts(captions, proc, model_ret, device, batch_size=len(captions)).cpu().numpy()
+    return text_vecs, visual_vecs
+
+class BatchSearchResult:
+    """Query x media score matrix. Videos are scored by their best frame."""
+    def __init__(self, queries, paths, scores, timestamps):
+        self.queries = queries
+        self.paths = paths
+        self.scores = scores
+        self.timestamps = timestamps
+
+    def top_k(self, k=10):
+        out = {}
+        for qi, query in enumerate(self.queries):
+            order = np.argsort(-self.scores[qi])[:k]
+            hits = []
+            for j in order:
+                hit = {'path': self.paths[j], 'score': float(self.scores[qi, j])}
+                if self.timestamps[qi][j]: hit['timestamp'] = self.timestamps[qi][j]
+                hits.append(hit)
+            out[query] = hits
+        return out
+
+    def save_csv(self, out_path):
+        with open(out_path, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["query"] + self.paths)
+            for qi, query in enumerate(self.queries):
+                writer.writerow([query] + [f"{s:.4f}" for s in self.scores[qi]])
+
+    def save_json(self, out_path, k=10):
+        data = {
+            'queries': self.queries,
+            'paths': self.paths,
+            'scores': np.round(self.scores.astype(np.float64), 4).tolist(),
+            'top_k': self.top_k(k),
+        }
+        with open(out_path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, indent=2)
+
+def best_per_path(row_scores, items):
+    """Reduces (num_queries, rows) scores to (num_queries, paths), keeping each video's best frame."""
+    paths, groups = [], {}
+    for i, it in enumerate(items):
+        if it['path'] not in groups:
+            groups[it['path']] = []
+            paths.append(it['path'])
+        groups[it['path']].append(i)
+
+    scores = np.zeros((len(row_scores), len(paths)), np.float32)
+    timestamps = [[""] * len(paths) for _ in range(len(row_scores))]
+    for j, path in enumerate(paths):
+        rows = groups[path]
+        if len(rows) == 1:
+            scores[:, j] = row_scores[:, rows[0]]
+            continue
+        best = np.asarray(rows)[row_scores[:, rows].argmax(1)]
+        scores[:, j] = row_scores[np.arange(len(row_scores)), best]
+        for qi, r in enumerate(best): timestamps[qi][j] = items[r].get('timestamp', "")
+    return paths, scores, timestamps
+
+def score_matrix(text_vecs, visual_vecs, items, tables):
+    """Scores all queries against all rows with two matrix products, then keeps the best row per path."""
+    row_scores = combine_vector_scores(text_vecs @ tables["caption"].T, visual_vecs @ tables["vision"].T)
+    return best_per_path(row_scores, items)
+
+def run_batch_search(queries, target_paths, settings=None, store_dir=INDEX_PATH, progress=None):
+    """
+    Runs many queries over the same targets. Each target is captioned/embedded at most once,
+    and not at all if the vector store already has an up-to-date row for it.
+    Newly embedded targets are written back to the store.
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    proc, model_gen, model_ret = get_engine_safe(device)
+    store = VectorStore(store_dir) if store_dir and VectorStore.exists(store_dir) else None
+    writer = VectorStoreWriter(store_dir, store.format if store else "f16") if store_dir else None
+    items, tables = embed_with_store(target_paths, store, proc, model_gen, model_ret, device, settings, progress, writer)
+    del store  # release the mapped generation before the writer replaces it
+    if writer: writer.close()
+    text_vecs, visual_vecs = encode_queries(queries, proc, model_gen, model_ret, device, settings)
+    paths, scores, timestamps = score_matrix(text_vecs, visual_vecs, items, tables)
+    return BatchSearchResult(list(queries), paths, scores, timestamps)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many saved queries over one media set.")
+    parser.add_argument("targets", nargs="+", help="media files or folders")
+    parser.add_argument("-q", "--query", action="append", default=[], help="text query or query image path (repeatable)")
+    parser.add_argument("--queries-file", help="one query per line")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--csv", help="write the score matrix as CSV")
+    parser.add_argument("--json", help="write scores + top-k as JSON")
+    parser.add_argument("--preset", default="quality", choices=["fast", "balanced", "quality"])
+    args = parser.parse_args()
+
+    queries = list(args.query)
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as fh:
+            queries += [line.strip() for line in fh if line.strip()]
+    if not queries:
+        parser.error("no queries given")
+
+    result = run_batch_search(queries, collect_all_media(args.targets), {'preset': args.preset},
+                              progress=lambda it: print(f" [BATCH] {os.path.basename(it['path'])}"))
+    if args.csv: result.save_csv(args.csv)
+    if args.json: result.save_json(args.json, args.top_k)
+    for query, hits in result.top_k(args.top_k).items():
+        print(f"\n{query}")
+        for hit in hits:
+            print(f"  {hit['score']:.1%}  {hit['path']}" + (f" @ {hit['timestamp']}" if 'timestamp' in hit else ""))
@@ -0,0 +1,114 @@
+import re, sys, time, json
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+# Decoding presets. num_beams=None means "use the sidebar beam size".
+CAPTION_PRESETS = {
+    "fast":     {"num_beams": 1, "max_new_tokens": 30},
+    "balanced": {"num_beams": 3, "max_new_tokens": 40},
+    "quality":  {"num_beams": None, "max_new_tokens": 60},
+}
+PRESET_KEYS = ["fast", "balanced", "quality"]
+# Images/frames per generate() call. Pixel inputs are all 384x384, so batches need no padding.
+CAPTION_BATCH = 8
+
+def generation_kwargs(preset, settings):
+    """Builds model.generate() arguments for a preset, honoring the UI settings."""
+    p = CAPTION_PRESETS.get(preset, CAPTION_PRESETS["quality"])
+    ui_beams = settings.get('num_beams', 5)
+    num_beams = ui_beams if p["num_beams"] is None else min(p["num_beams"], ui_beams)
+    max_new = p["max_new_tokens"]
+    kwargs = {
+        'max_new_tokens': max_new,
+        'min_length': min(settings.get('min_length', 20), max_new),
+        'num_beams': num_beams,
+        'repetition_penalty': settings.get('repetition_penalty', 1.2),
+    }
+    if num_beams > 1:
+        kwargs['length_penalty'] = settings.get('length_penalty', 2.0)
+        kwargs['early_stopping'] = True
+    return kwargs
+
+def generate_captions(model, pixel_values, proc, preset="quality", settings=None, batch_size=CAPTION_BATCH):
+    """Captions a stack of preprocessed images in batches. Beams stop as soon as all hypotheses are done."""
+    kwargs = generation_kwargs(preset, settings or {})
+    captions = []
+    with torch.no_grad():
+        for s in range(0, len(pixel_values), batch_size):
+            out = model.generate(pixel_values=pixel_values[s:s + batch_size], **kwargs)
+            captions.extend(proc.batch_decode(out, skip_special_tokens=True))
+    return captions
+
+def encode_texts(texts, proc, model_ret, device, batch_size=32):
+    """
+    Encodes many captions into normalized text_proj vectors.
+    Texts are sorted by token length and batched in buckets so padding stays small.
+    """
+    if not texts: return torch.empty(0, model_ret.config.image_text_hidden_size)
+    lengths = [len(ids) for ids in proc.tokenizer(texts)["input_ids"]]
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
+    out = [None] * len(texts)
+    with torch.no_grad():
+        for s in range(0, len(order), batch_size):
+            idx = order[s:s + batch_size]
+            inputs = proc(text=[texts[i] for i in idx], return_tensors="pt", padding=True).to(device)
+            vecs = F.normalize(model_ret.text_proj(model_ret.text_encoder(**inputs).last_hidden_state[:, 0, :]), p=2, dim=-1)
+            for i, v in zip(idx, vecs): out[i] = v
+    return torch.stack(out)
+
+def encode_images(pixel_values, model_ret):
+    """Normalized vision_proj vectors for a batch of preprocessed images."""
+    with torch.no_grad():
+        return F.normalize(model_ret.vision_proj(model_ret.vision_model(pixel_values).last_hidden_state[:, 0, :]), p=2, dim=-1)
+
+def caption_agreement(a, b):
+    """Word-overlap (Jaccard) between two captions, 1.0 = same words."""
+    wa, wb = set(re.findall(r'\w+', a.lower())), set(re.findall(r'\w+', b.lower()))
+    if not wa and not wb: return 1.0
+    return len(wa & wb) / len(wa | wb)
+
+def benchmark_presets(image_paths, settings=None, batch_size=8):
+    """
+    Runs every preset over the same images and reports captions/sec and
+    agreement with the 'quality' captions.
+    """
+    from engine.ai_worker import get_engine_safe
+    settings = settings or {}
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    proc, model_gen, _ = get_engine_safe(device)
+    images = [Image.open(p).convert('RGB') for p in image_paths]
+    pixel_values = proc(images=images, return_tensors="pt").pixel_values.to(device)
+
+    runs = {}
+    for preset in reversed(PRESET_KEYS):
+        # Untimed full-size batch first: each beam count has its own first-call allocation cost.
+        generate_captions(model_gen, pixel_values[:batch_size], proc, preset, settings, batch_size)
+        start = time.perf_counter()
+        captions = generate_captions(model_gen, pixel_values, proc, preset, settings, batch_size)
+        elapsed = time.perf_counter() - start
+        runs[preset] = {'captions': captions, 'seconds': elapsed}
+
+    reference = runs["quality"]['captions']
+    report = {}
+    for preset in PRESET_KEYS:
+        run = runs[preset]
+        agree = [caption_agreement(c, r) for c, r in zip(run['captions'], reference)]
+        report[preset] = {
+            'captions_per_sec': len(images) / run['seconds'] if run['seconds'] > 0 else 0.0,
+            'agreement': sum(agree) / len(agree) if agree else 0.0,
+            'generate_kwargs': generation_kwargs(preset, settings),
+        }
+    return report
+
+if __name__ == "__main__":
+    from engine.processor import collect_all_media, IMG_EXTS
+    paths = [p for p in collect_all_media(sys.argv[1:] or ["test"]) if p.lower().endswith(IMG_EXTS)]
+    if not paths:
+        print("No images found.")
+        sys.exit(1)
+    report = benchmark_presets(sorted(paths))
+    print(f"{'preset':<10} {'captions/s':>10} {'agreement':>10}")
+    for name, row in report.items():
+        print(f"{name:<10} {row['captions_per_sec']:>10.2f} {row['agreement']:>10.1%}")
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,142 @@
+import os, csv, json, time, hashlib, argparse
+import numpy as np
+
+from engine.vector_store import VectorStore, INDEX_PATH
+
+CLUSTERS_FILE = "clusters.json"
+
+def path_vectors(store, paths=None):
+    """
+    One normalized vision vector per path (videos: mean of their frames), kept as float16
+    so 100k items stay around 50 MB.
+    """
+    wanted = set(paths) if paths is not None else None
+    index, names = {}, []
+    row_group = np.full(len(store), -1, dtype=np.int64)
+    for i, it in enumerate(store.items):
+        if wanted is not None and it['path'] not in wanted: continue
+        if it['path'] not in index:
+            index[it['path']] = len(names)
+            names.append(it['path'])
+        row_group[i] = index[it['path']]
+
+    sums = np.zeros((len(names), store.dim), np.float32)
+    for s in range(0, len(store), 65536):
+        gid = row_group[s:s + 65536]
+        keep = gid >= 0
+        if keep.any(): np.add.at(sums, gid[keep], store.vectors("vision", s, s + 65536)[keep])
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    return names, (sums / np.maximum(norms, 1e-12)).astype(np.float16)
+
+def similar_pairs(vectors, threshold, block=4096):
+    """
+    Yields (i, j, sim) for all i < j with cosine >= threshold.
+    All-pairs similarity runs block x block, so at most block^2 scores are in memory at once.
+    """
+    n = len(vectors)
+    for bi in range(0, n, block):
+        xi = vectors[bi:bi + block].astype(np.float32)
+        for bj in range(bi, n, block):
+            xj = xi if bj == bi else vectors[bj:bj + block].astype(np.float32)
+            sims = xi @ xj.T
+            ii, jj = np.nonzero(sims >= threshold)
+            if bj == bi:
+                upper = jj > ii
+                ii, jj = ii[upper], jj[upper]
+            for a, b in zip(ii.tolist(), jj.tolist()):
+                yield bi + a, bj + b, float(sims[a, b])
+
+def _find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+def _union(parent, i, j):
+    ri, rj = _find(parent, i), _find(parent, j)
+    if ri != rj: parent[max(ri, rj)] = min(ri, rj)
+
+def _groups(parent):
+    """Clusters (index lists, size >= 2) from a union-find forest, largest first."""
+    groups = {}
+    for i in range(len(parent)): groups.setdefault(_find(parent, i), []).append(i)
+    return sorted((g for g in groups.values() if len(g) > 1), key=lambda g: (-len(g), g[0]))
+
+def cluster_pairs(n, pairs):
+    """Union-find over the pairs. Returns clusters (index lists, size >= 2), largest first."""
+    parent = list(range(n))
+    for i, j, _ in pairs: _union(parent, i, j)
+    return _groups(parent)
+
+def _scope_key(paths):
+    """Identifies the path subset a report covers (None = the whole store)."""
+    if paths is None: return None
+    return hashlib.md5("\n".join(sorted(paths)).encode("utf-8")).hexdigest()
+
+def _store_mtime(store_dir):
+    return os.path.getmtime(os.path.join(store_dir, "meta.json"))
+
+def cluster_store(store_dir=INDEX_PATH, threshold=0.9, paths=None, pairs_csv=None, block=4096):
+    """
+    Groups the stored items whose vision_proj embeddings are at least `threshold` similar
+    and writes <store_dir>/clusters.json. Returns the written report.
+    Pairs are merged into the union-find (and streamed to pairs_csv) as each block yields them,
+    so memory stays bounded by the vectors plus one block of scores.
+    """
+    start = time.perf_counter()
+    names, vectors = path_vectors(VectorStore(store_dir), paths)
+    parent = list(range(len(names)))
+    num_pairs = 0
+    fh = open(pairs_csv, "w", newline="", encoding="utf-8") if pairs_csv else None
+    try:
+        writer = csv.writer(fh) if fh else None
+        if writer: writer.writerow(["path_a", "path_b", "similarity"])
+        for i, j, sim in similar_pairs(vectors, threshold, block):
+            _union(parent, i, j)
+            num_pairs += 1
+            if writer: writer.writerow([names[i], names[j], f"{sim:.4f}"])
+    finally:
+        if fh: fh.close()
+
+    clusters = _groups(parent)
+    report = {
+        'threshold': threshold,
+        'items': len(names),
+        'pairs': num_pairs,
+        'seconds': round(time.perf_counter() - start, 2),
+        'store_mtime': _store_mtime(store_dir),
+        'scope': _scope_key(paths),
+        'clusters': [{'id': k, 'size': len(g), 'paths': [names[i] for i in g]} for k, g in enumerate(clusters)],
+    }
+    tmp_path = os.path.join(store_dir, CLUSTERS_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    os.replace(tmp_path, os.path.join(store_dir, CLUSTERS_FILE))
+    return report
+
+def load_clusters(store_dir=INDEX_PATH, threshold=None, paths=None):
+    """
+    Reads the last clusters.json, or None if no clustering job has run.
+    With a threshold, returns None unless the report was computed at that threshold over the
+    same paths and the store has not been written since, i.e. it can stand in for a new run.
+    """
+    path = os.path.join(store_dir, CLUSTERS_FILE)
+    if not os.path.exists(path): return None
+    with open(path, encoding="utf-8") as fh:
+        report = json.load(fh)
+    if threshold is None: return report
+    try: fresh = report.get('store_mtime') == _store_mtime(store_dir)
+    except OSError: fresh = False
+    if not fresh or report.get('threshold') != threshold or report.get('scope') != _scope_key(paths): return None
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find near-duplicate / similar media in the index.")
+    parser.add_argument("--store", default=INDEX_PATH)
+    parser.add_argument("--threshold", type=float, default=0.9, help="cosine similarity of vision embeddings")
+    parser.add_argument("--block", type=int, default=4096, help="rows per block (memory ~ block^2 * 4 bytes)")
+    parser.add_argument("--pairs-csv", help="also write every similar pair")
+    args = parser.parse_args()
+
+    report = cluster_store(args.store, args.threshold, pairs_csv=args.pairs_csv, block=args.block)
+    print(f" [CLUSTER] {report['items']} items, {report['pairs']} pairs, {len(report['clusters'])} clusters in {report['seconds']} s")
@@ -0,0 +1,105 @@
+import os
+import cv2
+import numpy as np
+
+from engine.captioning import generate_captions, encode_texts, encode_images
+from engine.processor import VID_EXTS, load_image_for_model, frame_to_model_rgb, PixelBuffer, file_signature
+from engine.vector_store import FIELDS
+
+FRAME_STEP_SEC = 2
+
+def iter_media_frames(paths, size=384):
+    """
+    Yields (item, rgb) for every image and every sampled video frame, already at model input size.
+    Videos are sampled every FRAME_STEP_SEC seconds, like AIWorker.process_vid_chunk.
+    Items carry the file's mtime/size.
+    """
+    for path in paths:
+        try: sig = file_signature(path)
+        except OSError as e:
+            print(f"[INDEX] skipping {os.path.basename(path)}: {e}")
+            continue
+        if path.lower().endswith(VID_EXTS):
+            cap_vid = cv2.VideoCapture(path)
+            fps = cap_vid.get(cv2.CAP_PROP_FPS) or 30
+            total = int(cap_vid.get(cv2.CAP_PROP_FRAME_COUNT))
+            for f_idx in range(0, total, int(fps * FRAME_STEP_SEC)):
+                cap_vid.set(cv2.CAP_PROP_POS_FRAMES, f_idx)
+                ret, frame = cap_vid.read()
+                if not ret: break
+                timestamp = f"{int(f_idx/fps//60)}:{int(f_idx/fps%60):02d}"
+                yield {'path': path, 'timestamp': timestamp, **sig}, frame_to_model_rgb(frame, size)
+            cap_vid.release()
+        else:
+            try: rgb = load_image_for_model(path, size)
+            except Exception as e:
+                print(f"[INDEX] skipping {os.path.basename(path)}: {e}")
+                continue
+            yield {'path': path, **sig}, rgb
+
+def embed_media(paths, proc, model_gen, model_ret, device, settings=None, batch_size=8, progress=None):
+    """
+    Captions and embeds every target exactly once.
+    Returns (items, tables) in the same layout write_store() expects.
+    """
+    settings = settings or {}
+    preset = settings.get('preset', 'quality')
+    items, vision, batch = [], [], []
+    buf = PixelBuffer(proc, batch_size, device)
+
+    def flush():
+        for i, (_, rgb) in enumerate(batch): buf.fill(i, rgb)
+        pixel_values = buf.pixel_values(len(batch))
+        vecs = encode_images(pixel_values, model_ret)
+        captions = generate_captions(model_gen, pixel_values, proc, preset, settings, batch_size)
+        for (item, _), cap in zip(batch, captions):
+            item['caption'] = cap
+            item['preset'] = preset
+            items.append(item)
+        vision.append(vecs.cpu().numpy())
+        batch.clear()
+
+    for item, rgb in iter_media_frames(paths, buf.size):
+        batch.append((item, rgb))
+        if len(batch) >= batch_size: flush()
+        if progress: progress(item)
+    if batch: flush()
+
+    dim = model_ret.config.image_text_hidden_size
+    caption_vecs = encode_texts([it['caption'] for it in items], proc, model_ret, device)
+    tables = {
+        "vision": np.concatenate(vision) if vision else np.empty((0, dim), np.float32),
+        "caption": caption_vecs.cpu().numpy().astype(np.float32),
+    }
+    return items, tables
+
+def is_fresh(item, path, preset):
+    """True if a stored item of path was made with this caption preset and the file's mtime/size still match."""
+    try: sig = file_signature(path)
+    except OSError: return False
+    return item.get('preset') == preset and item.get('mtime') == sig['mtime'] and item.get('size') == sig['size']
+
+def embed_with_store(paths, store, proc, model_gen, model_ret, device, settings=None, progress=None, writer=None):
+    """
+    Like embed_media, but reuses rows already in a VectorStore.
+    A path's rows are reused only if its mtime/size and caption preset still match;
+    everything else is processed again and, if a VectorStoreWriter is given, written back.
+    """
+    preset = (settings or {}).get('preset', 'quality')
+    cached_rows = {}
+    if store is not None:
+        for i, it in enumerate(store.items):
+            cached_rows.setdefault(it['path'], []).append(i)
+
+    fresh = {p for p in set(paths) if p in cached_rows and is_fresh(store.items[cached_rows[p][0]], p, preset)}
+    missing = [p for p in paths if p not in fresh]
+    items, tables = embed_media(missing, proc, model_gen, model_ret, device, settings, progress=progress)
+    if writer is not None:
+        for i, it in enumerate(items): writer.add(it, tables["vision"][i], tables["caption"][i])
+
+    rows = [i for p in paths if p in fresh for i in cached_rows[p]]
+    if rows:
+        items = [store.items[i] for i in rows] + items
+        for field in FIELDS:
+            tables[field] = np.concatenate([store.take(field, rows), tables[field]])
+    return items, tables
@@ -0,0 +1,59 @@
+import numpy as np
+
+from engine.ai_worker import clean_words, combine_keyword_scores, combine_vector_scores
+
+class LiveIndex:
+    """
+    In-memory copy of the stored rows for the files in view.
+    Re-ranking is a matrix-vector product (vector mode) or an inverted-index count (keyword mode),
+    followed by a per-path max, so no AIWorker scan is needed.
+    """
+    def __init__(self, store, paths):
+        wanted = set(paths)
+        rows = sorted((i for i, it in enumerate(store.items) if it['path'] in wanted), key=lambda i: store.items[i]['path'])
+        self.items = [store.items[i] for i in rows]
+        dim = store.dim
+        self.vision = store.take("vision", rows) if rows else np.empty((0, dim), np.float32)
+        self.caption = store.take("caption", rows) if rows else np.empty((0, dim), np.float32)
+
+        row_paths = [it['path'] for it in self.items]
+        starts = [i for i in range(len(row_paths)) if i == 0 or row_paths[i] != row_paths[i - 1]]
+        self.paths = [row_paths[s] for s in starts]
+        self.group_starts = np.asarray(starts, dtype=np.int64)
+        self.group_ids = np.repeat(np.arange(len(starts)), np.diff(np.append(self.group_starts, len(row_paths))))
+
+        word_rows = {}
+        for i, it in enumerate(self.items):
+            for w in set(clean_words(it.get('caption', ""))):
+                word_rows.setdefault(w, []).append(i)
+        self.word_rows = {w: np.asarray(r, dtype=np.int64) for w, r in word_rows.items()}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _rank(self, row_scores):
+        """
+        Best row per path. Returns (scores, rows): arrays aligned with self.paths, where rows[g]
+        is the row (item) that produced path g's score. Ordering is left to the caller.
+        """
+        if not len(self.paths): return np.empty(0, np.float32), np.empty(0, np.int64)
+        best = np.maximum.reduceat(row_scores, self.group_starts)
+        hits = np.flatnonzero(row_scores == best[self.group_ids])
+        groups, first = np.unique(self.group_ids[hits], return_index=True)
+        best_rows = np.empty(len(self.paths), dtype=np.int64)
+        best_rows[groups] = hits[first]
+        return best, best_rows
+
+    def rank_vector(self, query_vec):
+        """Same scoring as AIWorker's vector mode for a text query (text vector on both sides)."""
+        q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+        return self._rank(combine_vector_scores(self.caption @ q, self.vision @ q))
+
+    def rank_keyword(self, query_text):
+        """Same scoring as AIWorker's keyword mode."""
+        query_words = clean_words(query_text)
+        counts = np.zeros(len(self.items), np.float32)
+        for w in query_words:
+            if w in self.word_rows: counts[self.word_rows[w]] += 1
+        text_score = counts / len(query_words) if query_words else counts
+        return self._rank(combine_keyword_scores(text_score, 0.0).astype(np.float32))
@@ -0,0 +1,97 @@
+import os, time, statistics
+import torch
+from transformers.modeling_outputs import BaseModelOutputWithPooling
+
+from engine.scheduler import default_workers
+from engine.captioning import CAPTION_BATCH
+
+WARMUP_TEXT = "a photo of a gray cat sitting on a wooden table"
+
+def configure_threads(workers=None):
+    """
+    Sizes torch's thread pools from the core count. Intra-op threads are split
+    between the `workers` pool threads so concurrent inferences don't oversubscribe.
+    """
+    cores = os.cpu_count() or 1
+    intra = max(1, cores // (workers or default_workers()))
+    torch.set_num_threads(intra)
+    try: torch.set_num_interop_threads(max(1, min(4, cores // 2)))
+    except RuntimeError: pass  # only allowed before the first inter-op parallel call
+    return intra
+
+class _TracedVision(torch.nn.Module):
+    """TorchScript vision encoder that still returns .last_hidden_state like the HF module."""
+    def __init__(self, traced):
+        super().__init__()
+        self.traced = traced
+
+    def forward(self, pixel_values, **kwargs):
+        out = self.traced(pixel_values)
+        return BaseModelOutputWithPooling(last_hidden_state=out["last_hidden_state"], pooler_output=out.get("pooler_output"))
+
+def _item_latency(proc, model_ret, device, size, runs=3, batch=1):
+    """Median ms for `batch` images + one caption through the retrieval encoders and projections."""
+    pixel_values = torch.zeros((batch, 3, size, size), device=device)
+    text = proc(text=WARMUP_TEXT, return_tensors="pt", padding=True).to(device)
+    times = []
+    with torch.no_grad():
+        for _ in range(runs):
+            start = time.perf_counter()
+            model_ret.vision_proj(model_ret.vision_model(pixel_values).last_hidden_state[:, 0, :])
+            model_ret.text_proj(model_ret.text_encoder(**text).last_hidden_state[:, 0, :])
+            if device.type == "cuda": torch.cuda.synchronize()
+            times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+def warmup(proc, model_gen, model_ret, device, size):
+    """
+    One pass over the shapes the scan uses (a single item and a full caption batch),
+    so compilation happens - and fails, if it is going to - during loading.
+    """
+    with torch.no_grad():
+        for batch in (1, CAPTION_BATCH):
+            _item_latency(proc, model_ret, device, size, runs=1, batch=batch)
+            model_gen.generate(pixel_values=torch.zeros((batch, 3, size, size), device=device), max_new_tokens=5, num_beams=1)
+
+def _compile(model_gen, model_ret, device, size):
+    model_ret.vision_model = torch.compile(model_ret.vision_model)
+    model_ret.text_encoder = torch.compile(model_ret.text_encoder, dynamic=True)
+    model_ret.vision_proj = torch.compile(model_ret.vision_proj)
+    model_ret.text_proj = torch.compile(model_ret.text_proj, dynamic=True)
+    model_gen.vision_model = torch.compile(model_gen.vision_model)
+
+def _trace(model_gen, model_ret, device, size):
+    # Tracing needs fixed shapes: only the image side and the linear heads qualify.
+    example = torch.zeros((1, 3, size, size), device=device)
+    hidden = model_ret.config.vision_config.hidden_size
+    with torch.no_grad():
+        model_ret.vision_model = _TracedVision(torch.jit.trace(model_ret.vision_model, example, strict=False))
+        model_ret.vision_proj = torch.jit.trace(model_ret.vision_proj, torch.zeros((1, hidden), device=device))
+        model_ret.text_proj = torch.jit.trace(model_ret.text_proj, torch.zeros((1, model_ret.config.text_config.hidden_size), device=device))
+
+def optimize_engine(proc, model_gen, model_ret, device):
+    """
+    Compiles the vision encoders, the text encoder and the projection heads, warms them up and
+    returns the before/after per-item latency. If compiling or its warmup fails, the eager modules
+    are restored and tracing is tried, then plain eager; 'mode' reports what is actually running.
+    """
+    intra = configure_threads()
+    size = proc.image_processor.size['height']
+    eager_ms = _item_latency(proc, model_ret, device, size)
+
+    eager = [(model_ret, name, getattr(model_ret, name)) for name in ("vision_model", "text_encoder", "vision_proj", "text_proj")]
+    eager.append((model_gen, "vision_model", model_gen.vision_model))
+    mode = "eager"
+    for name, apply in (("compile", _compile), ("torchscript", _trace)):
+        if name == "compile" and not hasattr(torch, "compile"): continue
+        try:
+            apply(model_gen, model_ret, device, size)
+            warmup(proc, model_gen, model_ret, device, size)
+            mode = name
+            break
+        except Exception as e:
+            print(f"[OPTIMIZE] {name} failed, falling back: {e}")
+            for model, attr, module in eager: setattr(model, attr, module)
+
+    optimized_ms = _item_latency(proc, model_ret, device, size)
+    return {'mode': mode, 'threads': intra, 'eager_ms': eager_ms, 'optimized_ms': optimized_ms}
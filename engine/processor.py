@@ -1,6 +1,8 @@
 import cv2
 import os
-from PIL import Image
+import numpy as np
+import torch
+from PIL import Image, ImageOps
 IMG_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".JPG", ".JPEG")
 VID_EXTS = (".mp4", ".avi", ".mkv", ".mov")
 
@@ -21,6 +23,50 @@ def collect_all_media(paths):
                 final_list.append(p)
     return list(set(final_list)) 
 
+def file_signature(path):
+    """mtime + size of a file, stored with its index rows so stale rows can be detected."""
+    st = os.stat(path)
+    return {'mtime': st.st_mtime, 'size': st.st_size}
+
+def load_image_for_model(path, size=384):
+    """
+    Decodes an image straight to the model input size (RGB uint8 array, size x size).
+    JPEGs are downscaled in the DCT domain via draft(), so a 6000x4000 photo is never fully decoded.
+    """
+    img = Image.open(path)
+    img.draft('RGB', (size, size))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB': img = img.convert('RGB')
+    return np.array(img.resize((size, size), Image.BICUBIC))
+
+def frame_to_model_rgb(frame, size=384):
+    """Shrinks a BGR video frame first, then converts only the small image to RGB."""
+    small = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+
+class PixelBuffer:
+    """
+    Preallocated (batch, 3, size, size) tensor, normalized in place with the processor's mean/std.
+    Replaces the per-item BlipProcessor image pipeline; one buffer per thread.
+    """
+    def __init__(self, proc, batch_size=1, device="cpu"):
+        ip = proc.image_processor
+        self.size = ip.size['height']
+        self.device = device
+        self.scale = ip.rescale_factor
+        self.mean = torch.tensor(ip.image_mean, dtype=torch.float32).view(3, 1, 1)
+        self.std = torch.tensor(ip.image_std, dtype=torch.float32).view(3, 1, 1)
+        self.buf = torch.empty((batch_size, 3, self.size, self.size), dtype=torch.float32)
+
+    def fill(self, i, rgb):
+        """Writes one size x size x 3 uint8 RGB array into slot i."""
+        slot = self.buf[i]
+        slot.copy_(torch.from_numpy(np.ascontiguousarray(rgb)).permute(2, 0, 1))
+        slot.mul_(self.scale).sub_(self.mean).div_(self.std)
+
+    def pixel_values(self, n=1):
+        return self.buf[:n].to(self.device)
+
 class MediaProcessor:
     def __init__(self):
         self.img_exts = IMG_EXTS
@@ -0,0 +1,43 @@
+import os, random, threading
+from collections import deque
+
+def default_workers():
+    """Pool size for scans: half the cores, at most 4 (each inference also uses intra-op threads)."""
+    return max(1, min(4, (os.cpu_count() or 2) // 2))
+
+class WorkStealingPool:
+    """
+    Runs (cost, task) pairs on a fixed set of threads.
+    Tasks are dealt out largest-first; each worker pops from the front of its own deque
+    and, once empty, steals from the back of another worker's deque.
+    Setting stop_requested (from any thread) makes the workers exit after their current task.
+    """
+    def __init__(self, num_workers):
+        self.num_workers = max(1, num_workers)
+        self.stop_requested = False
+
+    def run(self, tasks, fn):
+        queues = [deque() for _ in range(self.num_workers)]
+        for i, (_, task) in enumerate(sorted(tasks, key=lambda t: -t[0])):
+            queues[i % self.num_workers].append(task)
+
+        def next_task(me):
+            try: return queues[me].popleft()
+            except IndexError: pass
+            victims = [v for v in range(self.num_workers) if v != me]
+            random.shuffle(victims)
+            for v in victims:
+                try: return queues[v].pop()
+                except IndexError: continue
+            return None
+
+        def loop(me):
+            while not self.stop_requested:
+                task = next_task(me)
+                if task is None: return
+                try: fn(task)
+                except Exception as e: print(f"[SCHEDULER ERROR]: {e}")
+
+        threads = [threading.Thread(target=loop, args=(i,), daemon=True) for i in range(self.num_workers)]
+        for t in threads: t.start()
+        for t in threads: t.join()
@@ -0,0 +1,173 @@
+import os, re, hashlib, heapq, argparse
+import multiprocessing as mp
+import numpy as np
+import torch
+
+from engine.ai_worker import get_engine_safe, combine_vector_scores
+from engine.batch_search import encode_queries, best_per_path
+from engine.indexer import embed_media, is_fresh
+from engine.processor import collect_all_media
+from engine.vector_store import VectorStore, VectorStoreWriter, INDEX_PATH
+
+SHARD_RE = re.compile(r"^shard-(\d{5})-of-(\d{5})$")
+# Resident memory of one indexing process (both BLIP models + activations).
+WORKER_RAM_GB = 3
+
+def path_key(path):
+    """Normalized absolute path. Skip checks and stored items use this key."""
+    return os.path.normcase(os.path.abspath(path)).replace("\\", "/")
+
+def target_root(targets):
+    """Common directory of the targets given on the command line; shard placement is relative to it."""
+    root = os.path.commonpath([os.path.abspath(t) for t in targets])
+    return root if os.path.isdir(root) else os.path.dirname(root)
+
+def shard_of(path, num_shards, base):
+    """
+    Deterministic shard id from the path relative to base, with forward slashes and case kept,
+    so every node puts a file in the same shard whatever its mount point or OS.
+    """
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(base)).replace("\\", "/")
+    return int(hashlib.md5(rel.encode("utf-8")).hexdigest(), 16) % num_shards
+
+def default_index_workers(device="cpu"):
+    """
+    One process per GPU on cuda. On CPU every process holds its own copy of the models,
+    so the count is bounded by RAM (one WORKER_RAM_GB share is left for the system), at most 4.
+    """
+    if str(device).startswith("cuda"): return max(1, torch.cuda.device_count())
+    try: total_gb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+    except (AttributeError, ValueError, OSError): return 2  # no sysconf (Windows)
+    return max(1, min(4, (os.cpu_count() or 1) // 2, int(total_gb // WORKER_RAM_GB) - 1))
+
+def shard_dir(root, shard_id, num_shards):
+    return os.path.join(root, f"shard-{shard_id:05d}-of-{num_shards:05d}")
+
+def build_shard(paths, shard_id, num_shards, base, root=INDEX_PATH, settings=None, fmt="f16", threads=None, device=None):
+    """
+    Indexes this shard's part of the file list into its own self-contained store.
+    Paths already in the shard with a matching mtime/size and preset are skipped, so nightly drops only cost new or changed files.
+    """
+    if threads: torch.set_num_threads(threads)
+    out_dir = shard_dir(root, shard_id, num_shards)
+    preset = (settings or {}).get('preset', 'quality')
+    mine = list(dict.fromkeys(path_key(p) for p in paths if shard_of(p, num_shards, base) == shard_id))
+    known = {}
+    if VectorStore.exists(out_dir):
+        for it in VectorStore(out_dir).items: known.setdefault(path_key(it['path']), it)
+    todo = [p for p in mine if p not in known or not is_fresh(known[p], p, preset)]
+    print(f" [SHARD {shard_id}/{num_shards}] {len(todo)} new or changed of {len(mine)} files")
+    if not todo: return 0
+
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    proc, model_gen, model_ret = get_engine_safe(device)
+    items, tables = embed_media(todo, proc, model_gen, model_ret, device, settings)
+    writer = VectorStoreWriter(out_dir, fmt)
+    for i, item in enumerate(items):
+        writer.add(item, tables["vision"][i], tables["caption"][i])
+    writer.close()
+    return len(todo)
+
+def _build_shards_job(args):
+    """One worker process: builds its list of shards one after another on its device."""
+    shards, num_shards, base, root, settings, fmt, threads, device = args
+    return sum(build_shard(paths, sid, num_shards, base, root, settings, fmt, threads, device) for paths, sid in shards)
+
+def index_parallel(paths, num_shards, base, shard_ids=None, workers=None, root=INDEX_PATH, settings=None, fmt="f16"):
+    """
+    Builds the given shards (default: all) in separate worker processes; paths are placed relative to base.
+    On cuda each process gets its own GPU; on CPU the default process count is RAM-bound.
+    """
+    shard_ids = list(range(num_shards)) if shard_ids is None else list(shard_ids)
+    if not shard_ids: return 0
+    gpus = torch.cuda.device_count() if torch.cuda.is_available() else 0
+    workers = max(1, min(workers or default_index_workers("cuda" if gpus else "cpu"), len(shard_ids)))
+    if gpus: workers = min(workers, gpus)
+    devices = [f"cuda:{w}" if gpus else "cpu" for w in range(workers)]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    by_shard = {sid: [] for sid in shard_ids}
+    for p in paths:
+        sid = shard_of(p, num_shards, base)
+        if sid in by_shard: by_shard[sid].append(p)
+    jobs = [([(by_shard[sid], sid) for sid in shard_ids[w::workers]], num_shards, base, root, settings, fmt, threads, devices[w])
+            for w in range(workers)]
+    if workers == 1:
+        return _build_shards_job(jobs[0])
+    # spawn: every worker loads its own models instead of inheriting torch/Qt state
+    with mp.get_context("spawn").Pool(workers) as pool:
+        return sum(pool.imap_unordered(_build_shards_job, jobs))
+
+class ShardedStore:
+    """Searches every shard under root and merges the per-shard top-k."""
+    def __init__(self, root=INDEX_PATH):
+        self.shards = []
+        counts = set()
+        for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+            match = SHARD_RE.match(name)
+            if match and VectorStore.exists(os.path.join(root, name)):
+                counts.add(int(match.group(2)))
+                self.shards.append(VectorStore(os.path.join(root, name)))
+        if len(counts) > 1:
+            raise ValueError(f"Mixed shard counts under {root}: {sorted(counts)}")
+
+    def __len__(self):
+        return sum(len(s) for s in self.shards)
+
+    def search(self, text_vecs, visual_vecs, k=10):
+        """Returns one merged hit list per query. Shards hold disjoint paths, so no cross-shard dedupe is needed."""
+        candidates = [[] for _ in range(len(text_vecs))]
+        for store in self.shards:
+            if not len(store): continue
+            row_scores = combine_vector_scores(store.scores("caption", text_vecs), store.scores("vision", visual_vecs))
+            paths, scores, timestamps = best_per_path(row_scores, store.items)
+            for qi in range(len(text_vecs)):
+                top = np.argsort(-scores[qi])[:k]
+                for j in top:
+                    hit = {'path': paths[j], 'score': float(scores[qi, j])}
+                    if timestamps[qi][j]: hit['timestamp'] = timestamps[qi][j]
+                    candidates[qi].append(hit)
+        return [heapq.nlargest(k, hits, key=lambda h: h['score']) for hits in candidates]
+
+def parse_shard_ids(spec, num_shards):
+    """'0,2,5-7' -> [0, 2, 5, 6, 7]"""
+    if not spec: return list(range(num_shards))
+    ids = []
+    for part in spec.split(","):
+        lo, _, hi = part.partition("-")
+        ids.extend(range(int(lo), int(hi or lo) + 1))
+    return [i for i in ids if 0 <= i < num_shards]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded indexing and cross-shard search.")
+    parser.add_argument("--root", default=INDEX_PATH, help="shared directory holding the shard stores")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_index = sub.add_parser("index", help="build (part of) the shards")
+    p_index.add_argument("targets", nargs="+")
+    p_index.add_argument("--num-shards", type=int, required=True)
+    p_index.add_argument("--base", help="directory shard placement is relative to; must name the same tree on every node (default: common directory of the targets)")
+    p_index.add_argument("--shards", help="shard ids this node builds, e.g. '0-3' (default: all)")
+    p_index.add_argument("--workers", type=int, default=None, help="processes (default: one per GPU, or what RAM allows on CPU)")
+    p_index.add_argument("--format", default="f16", choices=["f16", "pq"])
+    p_index.add_argument("--preset", default="quality", choices=["fast", "balanced", "quality"])
+
+    p_query = sub.add_parser("query", help="search across all shards")
+    p_query.add_argument("queries", nargs="+", help="text queries or query image paths")
+    p_query.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.cmd == "index":
+        ids = parse_shard_ids(args.shards, args.num_shards)
+        base = args.base or target_root(args.targets)
+        done = index_parallel(collect_all_media(args.targets), args.num_shards, base, ids, args.workers, args.root, {'preset': args.preset}, args.format)
+        print(f" [SHARD] indexed {done} new files into {len(ids)} shards")
+    else:
+        store = ShardedStore(args.root)
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        proc, model_gen, model_ret = get_engine_safe(device)
+        text_vecs, visual_vecs = encode_queries(args.queries, proc, model_gen, model_ret, device)
+        for query, hits in zip(args.queries, store.search(text_vecs, visual_vecs, args.top_k)):
+            print(f"\n{query}")
+            for hit in hits:
+                print(f"  {hit['score']:.1%}  {hit['path']}" + (f" @ {hit['timestamp']}" if 'timestamp' in hit else ""))
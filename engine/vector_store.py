@@ -0,0 +1,422 @@
+import os, json, uuid, hashlib, threading
+import numpy as np
+
+INDEX_PATH = os.path.join(os.getcwd(), "ai_index")
+FIELDS = ("vision", "caption")
+BLOCK_ROWS = 65536
+# PQ stores keep new rows in float16 until there are enough of them to train full 256-centroid
+# codebooks, and retrain automatically once the store has grown PQ_RETRAIN_GROWTH times past its training set.
+PQ_MIN_ROWS = 4096
+PQ_KSUB = 256
+PQ_RETRAIN_GROWTH = 4
+
+def _nearest(x, cent):
+    d = (cent * cent).sum(1)[None, :] - 2.0 * (x @ cent.T)
+    return d.argmin(1)
+
+def train_pq(data, m=32, ksub=PQ_KSUB, iters=20, sample=65536, seed=0):
+    """
+    Trains one k-means codebook per subspace.
+    Returns a float32 array of shape (m, ksub, dim // m).
+    """
+    data = np.asarray(data, dtype=np.float32)
+    n, dim = data.shape
+    if dim % m: raise ValueError(f"dim {dim} is not divisible by pq_m {m}")
+    rng = np.random.default_rng(seed)
+    if n > sample: data = data[rng.choice(n, sample, replace=False)]
+    ksub, dsub = min(ksub, len(data)), dim // m
+    books = np.empty((m, ksub, dsub), np.float32)
+    for j in range(m):
+        sub = np.ascontiguousarray(data[:, j * dsub:(j + 1) * dsub])
+        cent = sub[rng.choice(len(sub), ksub, replace=False)].copy()
+        for _ in range(iters):
+            assign = _nearest(sub, cent)
+            counts = np.bincount(assign, minlength=ksub)
+            filled = counts > 0
+            for d in range(dsub):
+                sums = np.bincount(assign, weights=sub[:, d], minlength=ksub)
+                cent[filled, d] = sums[filled] / counts[filled]
+        books[j] = cent
+    return books
+
+def encode_pq(data, books):
+    m, _, dsub = books.shape
+    codes = np.empty((len(data), m), np.uint8)
+    for s in range(0, len(data), BLOCK_ROWS):
+        block = np.asarray(data[s:s + BLOCK_ROWS], dtype=np.float32)
+        for j in range(m):
+            codes[s:s + len(block), j] = _nearest(block[:, j * dsub:(j + 1) * dsub], books[j])
+    return codes
+
+def path_hashes(paths):
+    """64-bit hashes of item paths; writers check these before loading a segment's items."""
+    return np.array([int.from_bytes(hashlib.md5(p.encode("utf-8")).digest()[:8], "little") for p in paths], dtype=np.uint64)
+
+class StoreLock:
+    """
+    Inter-process write lock on <store_dir>/.lock, held from reading meta.json until the new one is
+    in place and stale files are removed, so a GUI scan and the batch-search CLI cannot interleave.
+    It is an OS file lock, so it is released if the holder dies.
+    """
+    def __init__(self, store_dir):
+        self.path = os.path.join(store_dir, ".lock")
+        self.fh = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fh = open(self.path, "a+")
+        if os.name == "nt":
+            import msvcrt
+            self.fh.seek(0)
+            while True:
+                try: msvcrt.locking(self.fh.fileno(), msvcrt.LK_LOCK, 1); break
+                except OSError: pass  # LK_LOCK gives up after ~10 s, keep waiting
+        else:
+            import fcntl
+            fcntl.flock(self.fh.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == "nt":
+            import msvcrt
+            self.fh.seek(0)
+            msvcrt.locking(self.fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self.fh.fileno(), fcntl.LOCK_UN)
+        self.fh.close()
+
+def _read_meta(store_dir):
+    path = os.path.join(store_dir, "meta.json")
+    if not os.path.exists(path): return None
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+def _legacy_meta(store_dir, meta):
+    """In-memory segment view of a single-generation store (items inline in meta.json)."""
+    files = meta["files"]
+    seg = {"id": None, "count": len(meta["items"]), "encoding": meta["format"], "items": None, "hashes": None,
+           "files": {k: v for k, v in files.items() if not k.endswith("_books")}, "inline_items": meta["items"]}
+    pq = None
+    if meta["format"] == "pq":
+        books = np.load(os.path.join(store_dir, files["vision_books"]))
+        pq = {"m": books.shape[0], "ksub": books.shape[1], "trained_rows": books.shape[1],
+              "books": {field: files[f"{field}_books"] for field in FIELDS}}
+    return {"format": meta["format"], "dim": meta["dim"], "count": seg["count"], "pq": pq, "segments": [seg]}
+
+def _segment_items(store_dir, seg):
+    if seg.get("inline_items") is not None: return seg["inline_items"]
+    with open(os.path.join(store_dir, seg["items"]), encoding="utf-8") as fh:
+        return json.load(fh)
+
+def _save_segment(store_dir, arrays, items, encoding, items_from=None):
+    """
+    Writes one immutable segment under a fresh id: a vector array per key, the items JSON and path hashes.
+    items_from reuses the items/hash files of a segment whose rows are only being re-encoded.
+    """
+    sid = uuid.uuid4().hex[:8]
+    files = {}
+    for key, arr in arrays.items():
+        files[key] = f"{key}-{sid}.npy"
+        np.save(os.path.join(store_dir, files[key]), arr)
+    if items_from is not None and items_from["items"] is not None:
+        return {"id": sid, "count": len(items), "encoding": encoding, "files": files,
+                "items": items_from["items"], "hashes": items_from["hashes"]}
+    seg = {"id": sid, "count": len(items), "encoding": encoding, "files": files,
+           "items": f"items-{sid}.json", "hashes": f"pathhash-{sid}.npy"}
+    with open(os.path.join(store_dir, seg["items"]), "w", encoding="utf-8") as fh:
+        json.dump(items, fh)
+    np.save(os.path.join(store_dir, seg["hashes"]), path_hashes([it["path"] for it in items]))
+    return seg
+
+def _referenced(meta):
+    names = set()
+    for seg in meta["segments"]:
+        names.update(seg["files"].values())
+        names.update(n for n in (seg["items"], seg["hashes"]) if n)
+    if meta["pq"]: names.update(meta["pq"]["books"].values())
+    return names
+
+def _remove_stale_files(store_dir, keep):
+    for name in os.listdir(store_dir):
+        if name.startswith(FIELDS + ("items-", "pathhash-")) and name not in keep:
+            try: os.remove(os.path.join(store_dir, name))
+            except OSError: pass  # still mapped by a reader, next write tries again
+
+def _write_meta(store_dir, meta):
+    """Replaces meta.json atomically, then removes files the new meta no longer references."""
+    meta = dict(meta, count=sum(seg["count"] for seg in meta["segments"]))
+    meta["segments"] = [{k: v for k, v in seg.items() if k != "inline_items"} for seg in meta["segments"]]
+    meta_path = os.path.join(store_dir, "meta.json")
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+    os.replace(tmp_path, meta_path)
+    _remove_stale_files(store_dir, _referenced(meta))
+
+def _encode(data, encoding, field, books):
+    data = np.asarray(data, dtype=np.float32)
+    if encoding == "pq": return {f"{field}_codes": encode_pq(data, books[field])}
+    return {field: data.astype(np.float16)}
+
+def _segment_arrays(view, k, rows, encoding, books):
+    """
+    Vector arrays for rows (local indices, or None for all) of segment k in the given encoding.
+    Rows already stored in that encoding with the same codebooks are copied without decoding.
+    """
+    seg = view.segments[k]
+    sel = np.arange(seg["count"]) if rows is None else np.asarray(rows, dtype=np.int64)
+    raw = seg["encoding"] == encoding and (encoding == "f16" or books is view.books)
+    arrays = {}
+    for field in FIELDS:
+        if raw:
+            key = f"{field}_codes" if encoding == "pq" else field
+            arrays[key] = np.asarray(seg["tables"][key][sel])
+            continue
+        parts = [_encode(view.take(field, view.starts[k] + sel[s:s + BLOCK_ROWS]), encoding, field, books) for s in range(0, len(sel), BLOCK_ROWS)]
+        arrays.update({key: np.concatenate([p[key] for p in parts]) for key in parts[0]} if parts else _encode(np.empty((0, view.dim)), encoding, field, books))
+    return arrays
+
+def _commit(store_dir, items, tables, fmt, pq_m, replace=False):
+    """
+    Merges new rows into the store; the caller holds StoreLock.
+    New rows go into a new segment and only segments holding re-scanned paths are rewritten.
+    A new segment is merged into the previous one while that one is no larger, so the
+    segment count stays logarithmic and each row is rewritten O(log n) times.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    meta = None if replace else _read_meta(store_dir)
+    dim = tables["vision"].shape[1]
+    if meta is None: meta = {"format": fmt, "dim": dim, "pq": None, "segments": []}
+    elif "segments" not in meta: meta = _legacy_meta(store_dir, meta)
+    view = VectorStore(store_dir, meta)
+
+    # Drop rows of re-scanned paths; only segments whose path hashes match are loaded and rewritten.
+    new_paths = {it["path"] for it in items}
+    new_hashes = path_hashes(new_paths)
+    segments = []
+    for k, seg in enumerate(meta["segments"]):
+        if seg["hashes"] is not None and not np.isin(np.load(os.path.join(store_dir, seg["hashes"])), new_hashes).any():
+            segments.append(seg)
+            continue
+        seg_items = view.items.segment(k)
+        keep = [i for i, it in enumerate(seg_items) if it["path"] not in new_paths]
+        if len(keep) == len(seg_items) and seg["hashes"] is not None: segments.append(seg)
+        elif keep: segments.append(_save_segment(store_dir, _segment_arrays(view, k, keep, seg["encoding"], view.books), [seg_items[i] for i in keep], seg["encoding"]))
+
+    pq, books = meta["pq"], view.books
+    total = sum(seg["count"] for seg in segments) + len(items)
+    if fmt == "pq" and total >= PQ_MIN_ROWS and (pq is None or pq["ksub"] < PQ_KSUB or total >= PQ_RETRAIN_GROWTH * pq["trained_rows"]):
+        # (Re)train on a sample of all rows, then re-encode every segment; items files are kept as they are.
+        view = VectorStore(store_dir, dict(meta, segments=segments))
+        sample = np.sort(np.random.default_rng(0).choice(len(view), min(len(view), 65536), replace=False))
+        books = {field: train_pq(np.concatenate([view.take(field, sample), tables[field]]), m=pq_m) for field in FIELDS}
+        segments = [_save_segment(store_dir, _segment_arrays(view, k, None, "pq", books), [None] * seg["count"], "pq", items_from=seg)
+                    for k, seg in enumerate(segments)]
+        pq = {"m": pq_m, "ksub": books["vision"].shape[1], "trained_rows": total, "books": {}}
+        for field in FIELDS:
+            pq["books"][field] = f"{field}_books-{uuid.uuid4().hex[:8]}.npy"
+            np.save(os.path.join(store_dir, pq["books"][field]), books[field])
+
+    encoding = "pq" if fmt == "pq" and pq is not None and total >= PQ_MIN_ROWS else "f16"
+    arrays = {}
+    for field in FIELDS: arrays.update(_encode(tables[field], encoding, field, books))
+    segments.append(_save_segment(store_dir, arrays, items, encoding))
+
+    while len(segments) > 1 and segments[-2]["count"] <= segments[-1]["count"]:
+        view = VectorStore(store_dir, dict(meta, pq=pq, segments=segments[-2:]))
+        if books is not None: view.books = books
+        parts = [_segment_arrays(view, k, None, encoding, books) for k in (0, 1)]
+        arrays = {key: np.concatenate([parts[0][key], parts[1][key]]) for key in parts[0]}
+        segments[-2:] = [_save_segment(store_dir, arrays, view.items.segment(0) + view.items.segment(1), encoding)]
+
+    if pq is not None and all(seg["encoding"] != "pq" for seg in segments): pq = None
+    _write_meta(store_dir, {"version": 2, "format": fmt, "dim": dim, "pq": pq, "segments": segments})
+
+def write_store(store_dir, items, tables, fmt="f16", pq_m=32):
+    """
+    Replaces the whole store with items + float32 vector tables.
+    PQ codebooks are trained once there are PQ_MIN_ROWS rows; smaller stores stay in float16.
+    """
+    tables = {field: np.asarray(tables[field], dtype=np.float32) for field in FIELDS}
+    with StoreLock(store_dir):
+        _commit(store_dir, items, tables, fmt, pq_m, replace=True)
+
+def retrain_pq(store_dir, pq_m=32):
+    """
+    Forces a codebook retrain and re-encode of the whole store.
+    Writers already retrain on their own as the store grows; this is for changing pq_m.
+    """
+    with StoreLock(store_dir):
+        store = VectorStore(store_dir)
+        tables = {field: store.vectors(field) for field in FIELDS}
+        items = list(store.items)
+        del store
+        _commit(store_dir, items, tables, "pq", pq_m, replace=True)
+
+class StoreItems:
+    """
+    Items of a store, aligned with its rows. Each segment's items file is parsed on first access,
+    so opening a store for search does not read any item JSON.
+    """
+    def __init__(self, store_dir, segments, starts):
+        self.store_dir, self.segments, self.starts = store_dir, segments, starts
+        self._cache = {}
+
+    def segment(self, k):
+        k %= len(self.segments)
+        if k not in self._cache: self._cache[k] = _segment_items(self.store_dir, self.segments[k])
+        return self._cache[k]
+
+    def __len__(self):
+        return int(self.starts[-1]) if len(self.starts) else 0
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError(i)
+        k = int(np.searchsorted(self.starts, i, side="right")) - 1
+        return self.segment(k)[i - int(self.starts[k])]
+
+    def __iter__(self):
+        for k in range(len(self.segments)):
+            yield from self.segment(k)
+
+class VectorStore:
+    """
+    Read-only view of an index made of append-only segments.
+    Vector tables are memory-mapped, so a search only touches the pages it scores; segments
+    may be float16 or PQ codes against the store's shared codebooks.
+    """
+    def __init__(self, store_dir, meta=None):
+        self.store_dir = store_dir
+        for attempt in range(3):
+            current = meta or _read_meta(store_dir)
+            if "segments" not in current: current = _legacy_meta(store_dir, current)
+            try:
+                self._open(current)
+                break
+            except FileNotFoundError:
+                # A writer replaced meta.json and removed the files between our reads.
+                if meta is not None or attempt == 2: raise
+
+    def _open(self, meta):
+        self.meta = meta
+        self.format = meta["format"]
+        self.dim = meta["dim"]
+        pq = meta["pq"]
+        self.books = {field: np.load(os.path.join(self.store_dir, pq["books"][field])) for field in FIELDS} if pq else None
+        self.segments = []
+        for seg in meta["segments"]:
+            tables = {key: np.load(os.path.join(self.store_dir, name), mmap_mode="r") for key, name in seg["files"].items()}
+            self.segments.append(dict(seg, tables=tables))
+        self.starts = np.concatenate([[0], np.cumsum([seg["count"] for seg in self.segments])]).astype(np.int64)
+        self.items = StoreItems(self.store_dir, self.segments, self.starts)
+
+    @staticmethod
+    def exists(store_dir):
+        return os.path.exists(os.path.join(store_dir, "meta.json"))
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def _decode(self, seg, field, sel):
+        if seg["encoding"] == "pq":
+            books = self.books[field]
+            codes = np.asarray(seg["tables"][f"{field}_codes"][sel])
+            return np.concatenate([books[j][codes[:, j]] for j in range(books.shape[0])], axis=1)
+        return np.asarray(seg["tables"][field][sel], dtype=np.float32)
+
+    def vectors(self, field, start=0, stop=None):
+        """Decoded float32 vectors for rows [start, stop)."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        parts = [np.empty((0, self.dim), np.float32)]
+        for k, seg in enumerate(self.segments):
+            lo, hi = max(start, self.starts[k]), min(stop, self.starts[k + 1])
+            if lo < hi: parts.append(self._decode(seg, field, slice(lo - self.starts[k], hi - self.starts[k])))
+        return np.concatenate(parts)
+
+    def take(self, field, rows):
+        """Decoded float32 vectors for an arbitrary list of row indices."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.dim), np.float32)
+        which = np.searchsorted(self.starts, rows, side="right") - 1
+        for k in np.unique(which):
+            mask = which == k
+            out[mask] = self._decode(self.segments[k], field, rows[mask] - self.starts[k])
+        return out
+
+    def scores(self, field, queries):
+        """
+        Inner products of (nq, dim) queries against every stored vector -> (nq, count).
+        PQ segments use asymmetric distance: one lookup table per query, summed over code columns.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        out = np.empty((len(queries), len(self)), np.float32)
+        lut = None
+        for k, seg in enumerate(self.segments):
+            base = self.starts[k]
+            if seg["encoding"] == "pq":
+                if lut is None:
+                    books = self.books[field]
+                    m, _, dsub = books.shape
+                    lut = np.einsum("mkd,qmd->qmk", books, queries.reshape(len(queries), m, dsub))
+                codes = seg["tables"][f"{field}_codes"]
+                for s in range(0, seg["count"], BLOCK_ROWS):
+                    block = np.asarray(codes[s:s + BLOCK_ROWS])
+                    acc = np.zeros((len(queries), len(block)), np.float32)
+                    for j in range(block.shape[1]):
+                        acc += lut[:, j, block[:, j]]
+                    out[:, base + s:base + s + len(block)] = acc
+            else:
+                table = seg["tables"][field]
+                for s in range(0, seg["count"], BLOCK_ROWS):
+                    block = np.asarray(table[s:s + BLOCK_ROWS], dtype=np.float32)
+                    out[:, base + s:base + s + len(block)] = queries @ block.T
+        return out
+
+    def search(self, field, query, k=10):
+        """Top-k (score, item) pairs for a single query vector."""
+        sims = self.scores(field, query)[0]
+        k = min(k, len(sims))
+        if k == 0: return []
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(float(sims[i]), self.items[i]) for i in top]
+
+class VectorStoreWriter:
+    """
+    Collects per-item vectors during a scan and appends them to the store on close().
+    Entries of re-scanned paths replace the old ones.
+    """
+    def __init__(self, store_dir, fmt="f16", pq_m=32):
+        self.store_dir, self.fmt, self.pq_m = store_dir, fmt, pq_m
+        self.items = []
+        self.rows = {field: [] for field in FIELDS}
+        self._lock = threading.Lock()
+
+    def add(self, item, vision_vec, caption_vec):
+        vision_vec = np.asarray(vision_vec, dtype=np.float32).reshape(-1)
+        caption_vec = np.asarray(caption_vec, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self.items.append(item)
+            self.rows["vision"].append(vision_vec)
+            self.rows["caption"].append(caption_vec)
+
+    def close(self):
+        if not self.items: return
+        items = list(self.items)
+        tables = {field: np.stack(rows) for field, rows in self.rows.items()}
+        self.items = []
+        self.rows = {field: [] for field in FIELDS}
+        with StoreLock(self.store_dir):
+            _commit(self.store_dir, items, tables, self.fmt, self.pq_m)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Vector store maintenance.")
+    parser.add_argument("command", choices=["retrain"], help="retrain: rebuild the PQ codebooks from the stored vectors")
+    parser.add_argument("--store", default=INDEX_PATH)
+    parser.add_argument("--pq-m", type=int, default=32)
+    args = parser.parse_args()
+    retrain_pq(args.store, args.pq_m)
+    print(f" [INDEX] retrained PQ codebooks in {args.store}")
@@ -0,0 +1,96 @@
+import os, csv, json
+import numpy as np
+
+import engine.indexer as indexer
+from engine.batch_search import BatchSearchResult, best_per_path
+from engine.processor import file_signature
+from engine.vector_store import VectorStore, VectorStoreWriter
+
+DIM = 4
+
+def stub_embed(calls):
+    """embed_media stand-in: one row per path with a vector derived from its name, no models involved."""
+    def embed(paths, proc, model_gen, model_ret, device, settings=None, batch_size=8, progress=None):
+        calls.append(list(paths))
+        preset = (settings or {}).get('preset', 'quality')
+        items = [{'path': p, 'caption': f"new {os.path.basename(p)}", 'preset': preset, **file_signature(p)} for p in paths]
+        vecs = np.array([[len(p), 1, 0, 0] for p in paths], np.float32).reshape(-1, DIM)
+        return items, {"vision": vecs, "caption": vecs}
+    return embed
+
+def make_files(tmp_path, names):
+    paths = []
+    for name in names:
+        path = str(tmp_path / name)
+        with open(path, "w") as fh: fh.write(name)
+        paths.append(path)
+    return paths
+
+def test_best_per_path_keeps_each_videos_best_frame_per_query():
+    items = [{'path': "a.jpg"}, {'path': "v.mp4", 'timestamp': "0:00"},
+             {'path': "v.mp4", 'timestamp': "0:02"}, {'path': "b.jpg"}]
+    row_scores = np.array([[0.1, 0.5, 0.9, 0.2],
+                           [0.3, 0.8, 0.4, 0.7]], np.float32)
+    paths, scores, timestamps = best_per_path(row_scores, items)
+    assert paths == ["a.jpg", "v.mp4", "b.jpg"]
+    np.testing.assert_allclose(scores, [[0.1, 0.9, 0.2], [0.3, 0.8, 0.7]])
+    assert timestamps == [["", "0:02", ""], ["", "0:00", ""]]
+
+def test_top_k_orders_hits_and_keeps_timestamps():
+    result = BatchSearchResult(["cat", "dog"], ["a.jpg", "v.mp4", "b.jpg"],
+                               np.array([[0.1, 0.9, 0.2], [0.3, 0.8, 0.7]], np.float32),
+                               [["", "0:02", ""], ["", "0:00", ""]])
+    top = result.top_k(2)
+    assert [h['path'] for h in top["cat"]] == ["v.mp4", "b.jpg"]
+    assert top["cat"][0]['timestamp'] == "0:02" and 'timestamp' not in top["cat"][1]
+    assert [h['path'] for h in top["dog"]] == ["v.mp4", "b.jpg"]
+
+def test_save_csv_and_json(tmp_path):
+    result = BatchSearchResult(["cat"], ["a.jpg", "b.jpg"], np.array([[0.25, 0.123456]], np.float32), [["", ""]])
+    result.save_csv(str(tmp_path / "out.csv"))
+    with open(tmp_path / "out.csv", newline="", encoding="utf-8") as fh:
+        assert list(csv.reader(fh)) == [["query", "a.jpg", "b.jpg"], ["cat", "0.2500", "0.1235"]]
+
+    result.save_json(str(tmp_path / "out.json"), k=1)
+    with open(tmp_path / "out.json", encoding="utf-8") as fh:
+        data = json.load(fh)
+    assert data['queries'] == ["cat"] and data['paths'] == ["a.jpg", "b.jpg"]
+    assert data['scores'] == [[0.25, 0.1235]]
+    assert data['top_k'] == {"cat": [{'path': "a.jpg", 'score': 0.25}]}
+
+def test_embed_with_store_reuses_only_fresh_rows(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(indexer, "embed_media", stub_embed(calls))
+    paths = make_files(tmp_path, ["a.jpg", "b.jpg", "c.jpg"])
+    store_dir = str(tmp_path / "store")
+
+    writer = VectorStoreWriter(store_dir)
+    indexer.embed_with_store(paths[:2], None, None, None, None, "cpu", writer=writer)
+    writer.close()
+    assert calls == [paths[:2]]
+
+    # a.jpg changed on disk, b.jpg is untouched, c.jpg was never indexed.
+    with open(paths[0], "w") as fh: fh.write("a.jpg, edited")
+    store = VectorStore(store_dir)
+    items, tables = indexer.embed_with_store(paths, store, None, None, None, "cpu")
+    assert calls[-1] == [paths[0], paths[2]]
+    assert [it['path'] for it in items] == [paths[1], paths[0], paths[2]]
+    assert len(tables["vision"]) == 3 and len(tables["caption"]) == 3
+
+    # A different caption preset invalidates every stored row.
+    indexer.embed_with_store(paths[:2], store, None, None, None, "cpu", settings={'preset': 'fast'})
+    assert calls[-1] == paths[:2]
+
+def test_embed_with_store_writes_back_new_rows(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(indexer, "embed_media", stub_embed(calls))
+    paths = make_files(tmp_path, ["a.jpg"])
+    store_dir = str(tmp_path / "store")
+    for _ in range(2):
+        store = VectorStore(store_dir) if VectorStore.exists(store_dir) else None
+        writer = VectorStoreWriter(store_dir)
+        indexer.embed_with_store(paths, store, None, None, None, "cpu", writer=writer)
+        del store
+        writer.close()
+    assert calls == [paths, []]
+    assert [it['path'] for it in VectorStore(store_dir).items] == paths
@@ -0,0 +1,24 @@
+from engine.captioning import CAPTION_PRESETS, PRESET_KEYS, generation_kwargs
+
+def test_preset_beams_are_capped_by_ui_setting():
+    assert generation_kwargs("balanced", {'num_beams': 5})['num_beams'] == 3
+    assert generation_kwargs("balanced", {'num_beams': 2})['num_beams'] == 2
+    assert generation_kwargs("quality", {'num_beams': 7})['num_beams'] == 7
+    assert generation_kwargs("fast", {'num_beams': 7})['num_beams'] == 1
+
+def test_min_length_is_clamped_to_max_new_tokens():
+    for preset in PRESET_KEYS:
+        kwargs = generation_kwargs(preset, {'min_length': 100})
+        assert kwargs['max_new_tokens'] == CAPTION_PRESETS[preset]["max_new_tokens"]
+        assert kwargs['min_length'] == kwargs['max_new_tokens']
+    assert generation_kwargs("quality", {'min_length': 10})['min_length'] == 10
+
+def test_length_penalty_only_with_beam_search():
+    fast = generation_kwargs("fast", {'length_penalty': 1.5})
+    assert 'length_penalty' not in fast and 'early_stopping' not in fast
+    balanced = generation_kwargs("balanced", {'length_penalty': 1.5})
+    assert balanced['length_penalty'] == 1.5 and balanced['early_stopping'] is True
+    assert 'length_penalty' not in generation_kwargs("quality", {'num_beams': 1})
+
+def test_unknown_preset_falls_back_to_quality():
+    assert generation_kwargs("nope", {}) == generation_kwargs("quality", {})
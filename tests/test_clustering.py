@@ -0,0 +1,49 @@
+import csv
+import numpy as np
+
+from engine.clustering import similar_pairs, cluster_pairs, cluster_store, load_clusters
+from engine.vector_store import VectorStoreWriter
+
+def clustered_vectors(groups, size, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((groups, dim))
+    x = np.repeat(centers, size, axis=0) + 0.05 * rng.standard_normal((groups * size, dim))
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+def write_items(store_dir, vectors):
+    writer = VectorStoreWriter(store_dir)
+    for i, v in enumerate(vectors): writer.add({'path': f"img{i:03d}.jpg"}, v, v)
+    writer.close()
+
+def test_similar_pairs_matches_brute_force_across_blocks():
+    x = clustered_vectors(4, 5)
+    sims = x @ x.T
+    expected = {(i, j) for i in range(len(x)) for j in range(i + 1, len(x)) if sims[i, j] >= 0.9}
+    assert {(i, j) for i, j, _ in similar_pairs(x.astype(np.float16), 0.9, block=3)} == expected
+
+def test_cluster_store_streams_pairs_and_groups(tmp_path):
+    store_dir = str(tmp_path / "store")
+    x = clustered_vectors(3, 4)
+    write_items(store_dir, x)
+    pairs_csv = str(tmp_path / "pairs.csv")
+    report = cluster_store(store_dir, 0.9, pairs_csv=pairs_csv, block=5)
+
+    assert [c['size'] for c in report['clusters']] == [4, 4, 4]
+    with open(pairs_csv, encoding="utf-8") as fh:
+        rows = list(csv.reader(fh))[1:]
+    assert len(rows) == report['pairs'] == 3 * 6
+    pairs = [(int(a[3:6]), int(b[3:6]), 0.0) for a, b, _ in rows]
+    assert [len(g) for g in cluster_pairs(len(x), pairs)] == [4, 4, 4]
+
+def test_load_clusters_reuses_only_matching_reports(tmp_path):
+    store_dir = str(tmp_path)
+    write_items(store_dir, clustered_vectors(2, 3))
+    cluster_store(store_dir, 0.9)
+
+    assert load_clusters(store_dir)['threshold'] == 0.9
+    assert load_clusters(store_dir, 0.9) is not None
+    assert load_clusters(store_dir, 0.8) is None
+    assert load_clusters(store_dir, 0.9, paths=["img000.jpg"]) is None
+
+    write_items(store_dir, clustered_vectors(1, 1, seed=1))
+    assert load_clusters(store_dir, 0.9) is None
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import torch
+
+from engine.ai_worker import AIWorker, clean_words
+from engine.live_search import LiveIndex
+from engine.vector_store import VectorStore, VectorStoreWriter
+
+CAPTIONS = {
+    "b.jpg": ["a cat sitting on a red sofa"],
+    "a.jpg": ["a dog in the park"],
+    "v.mp4": ["a man walking a dog", "a cat and a dog playing", "an empty street at night"],
+    "c.jpg": ["mountains under snow"],
+}
+
+def unit(x):
+    return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(0)
+    writer = VectorStoreWriter(str(tmp_path))
+    for path, caps in CAPTIONS.items():
+        for i, cap in enumerate(caps):
+            item = {'path': path, 'caption': cap}
+            if len(caps) > 1: item['timestamp'] = f"0:{2 * i:02d}"
+            writer.add(item, unit(rng.standard_normal(16)), unit(rng.standard_normal(16)))
+    writer.close()
+    return VectorStore(str(tmp_path))
+
+def worker_best(store, score_item):
+    """AIWorker-style result: every row scored on its own, best row kept per path."""
+    best = {}
+    vision, caption = store.vectors("vision"), store.vectors("caption")
+    for i, it in enumerate(store.items):
+        score = score_item(it, vision[i], caption[i])
+        if it['path'] not in best or score > best[it['path']][0]: best[it['path']] = (score, it)
+    return best
+
+def assert_same_ranking(live, ranked, expected):
+    scores, rows = ranked
+    assert sorted(live.paths) == sorted(expected)
+    for g, path in enumerate(live.paths):
+        score, item = expected[path]
+        assert scores[g] == pytest.approx(score, abs=1e-4)  # cosine_similarity renormalizes the float16 rows
+        assert live.items[rows[g]] == item
+
+def test_rank_vector_matches_worker_scoring(store):
+    live = LiveIndex(store, list(CAPTIONS))
+    worker = AIWorker("", None, [], {'mode': 'vector'})
+    q = unit(np.random.default_rng(1).standard_normal(16))
+    worker.query_text_vec = worker.visual_query_vec = torch.from_numpy(q)[None]
+    expected = worker_best(store, lambda it, vis, cap: worker.calculate_vector_score(torch.from_numpy(cap)[None], torch.from_numpy(vis)[None]))
+    assert_same_ranking(live, live.rank_vector(q), expected)
+
+@pytest.mark.parametrize("query", ["cat dog", "a dog", "snow", "zebra", "the"])
+def test_rank_keyword_matches_worker_scoring(store, query):
+    live = LiveIndex(store, list(CAPTIONS))
+    worker = AIWorker(query, None, [], {'mode': 'keyword'})
+    worker.query_words = clean_words(query)
+    expected = worker_best(store, lambda it, vis, cap: worker.calculate_strict_keyword_score(it['caption'], 0.0))
+    assert_same_ranking(live, live.rank_keyword(query), expected)
+
+def test_live_index_only_holds_paths_in_view(store):
+    live = LiveIndex(store, ["v.mp4", "c.jpg", "missing.jpg"])
+    assert live.paths == ["c.jpg", "v.mp4"]
+    assert len(live.items) == 4 and live.vision.shape == (4, 16)
@@ -0,0 +1,64 @@
+import threading
+import cv2
+
+import engine.ai_worker as ai_worker
+from engine.ai_worker import AIWorker
+from engine.indexer import FRAME_STEP_SEC
+from engine.scheduler import WorkStealingPool
+
+def test_single_worker_runs_largest_tasks_first():
+    order = []
+    WorkStealingPool(1).run([(1, "s"), (5, "l"), (3, "m"), (4, "m2")], order.append)
+    assert order == ["l", "m2", "m", "s"]
+
+def test_idle_worker_steals_from_busy_one():
+    # Dealt round-robin: worker 0 gets big, a, c; worker 1 gets slow, b, d.
+    # slow blocks until every other task ran, which only happens if worker 0 steals b and d.
+    slow_started, others_done, lock, ran_on = threading.Event(), threading.Event(), threading.Lock(), {}
+    tasks = [(10, "big"), (9, "slow"), (1, "a"), (1, "b"), (1, "c"), (1, "d")]
+    def fn(task):
+        if task == "big": slow_started.wait(5)
+        if task == "slow":
+            slow_started.set()
+            others_done.wait(5)
+        with lock:
+            ran_on[task] = threading.get_ident()
+            if len(ran_on) == 5 and "slow" not in ran_on: others_done.set()
+    WorkStealingPool(2).run(tasks, fn)
+    assert others_done.is_set()
+    assert len({ran_on[t] for t in ("big", "a", "b", "c", "d")}) == 1
+    assert ran_on["slow"] != ran_on["big"]
+
+def test_stop_requested_drops_queued_tasks():
+    pool, ran = WorkStealingPool(1), []
+    def fn(task):
+        ran.append(task)
+        pool.stop_requested = True
+    pool.run([(3, "a"), (2, "b"), (1, "c")], fn)
+    assert ran == ["a"]
+
+def test_failing_task_does_not_stop_the_worker():
+    ran = []
+    def fn(task):
+        if task == "bad": raise ValueError(task)
+        ran.append(task)
+    WorkStealingPool(1).run([(2, "bad"), (1, "ok")], fn)
+    assert ran == ["ok"]
+
+class FakeCapture:
+    def __init__(self, path): pass
+    def get(self, prop): return {cv2.CAP_PROP_FPS: 10.0, cv2.CAP_PROP_FRAME_COUNT: 200.0}[prop]
+    def release(self): pass
+
+def test_plan_tasks_splits_videos_into_time_chunks(monkeypatch):
+    monkeypatch.setattr(ai_worker.cv2, "VideoCapture", FakeCapture)
+    worker = AIWorker("", None, ["v.mp4", "a.jpg", "b.jpg", "c.jpg"], {'chunk_sec': 6, 'batch_size': 2})
+    tasks = worker.plan_tasks()
+
+    step = int(10 * FRAME_STEP_SEC)
+    per_chunk = 6 // FRAME_STEP_SEC
+    frames = list(range(0, 200, step))
+    chunks = [frames[s:s + per_chunk] for s in range(0, len(frames), per_chunk)]
+    assert [t for t in tasks if t[1][0] == 'vid'] == [(len(c), ('vid', "v.mp4", c, 10.0)) for c in chunks]
+    assert [t for t in tasks if t[1][0] == 'imgs'] == [(2, ('imgs', ["a.jpg", "b.jpg"])), (1, ('imgs', ["c.jpg"]))]
+    assert worker._video_state["v.mp4"]['pending'] == len(chunks)
@@ -0,0 +1,235 @@
+import os, json
+import numpy as np
+import pytest
+
+import threading, time
+import engine.vector_store as vector_store
+from engine.vector_store import (
+    FIELDS, train_pq, encode_pq, write_store, retrain_pq, StoreLock, VectorStore, VectorStoreWriter,
+)
+
+DIM = 64
+
+def unit_rows(n, seed):
+    x = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def add_rows(writer, paths, seed):
+    vis, cap = unit_rows(len(paths), seed), unit_rows(len(paths), seed + 1000)
+    for i, p in enumerate(paths):
+        writer.add({'path': p, 'caption': f"caption {p}"}, vis[i], cap[i])
+    return vis, cap
+
+def test_train_pq_shapes():
+    books = train_pq(unit_rows(500, 0), m=8, ksub=16)
+    assert books.shape == (8, 16, DIM // 8)
+    assert books.dtype == np.float32
+
+def test_train_pq_caps_ksub_at_row_count():
+    assert train_pq(unit_rows(10, 0), m=8).shape == (8, 10, DIM // 8)
+
+def test_encode_pq_picks_nearest_centroid():
+    data = unit_rows(300, 1)
+    books = train_pq(data, m=8, ksub=16)
+    codes = encode_pq(data, books)
+    assert codes.shape == (300, 8) and codes.dtype == np.uint8
+    dsub = DIM // 8
+    for j in range(8):
+        sub = data[:, j * dsub:(j + 1) * dsub]
+        dist = ((sub[:, None, :] - books[j][None]) ** 2).sum(-1)
+        np.testing.assert_allclose(dist[np.arange(300), codes[:, j]], dist.min(1), rtol=1e-5, atol=1e-6)
+
+def clustered_rows(n, seed, groups=16):
+    rng = np.random.default_rng(seed)
+    centers = np.random.default_rng(99).standard_normal((groups, DIM))
+    x = centers[rng.integers(0, groups, n)] + 0.3 * rng.standard_normal((n, DIM))
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+def read_meta(store_dir):
+    with open(os.path.join(store_dir, "meta.json"), encoding="utf-8") as fh:
+        return json.load(fh)
+
+@pytest.fixture
+def small_pq(monkeypatch):
+    monkeypatch.setattr(vector_store, "PQ_MIN_ROWS", 100)
+
+@pytest.mark.parametrize("fmt", ["f16", "pq"])
+def test_scores_match_decoded_vectors(tmp_path, fmt, small_pq):
+    data = unit_rows(400, 2)
+    items = [{'path': f"p{i}.jpg"} for i in range(400)]
+    write_store(str(tmp_path), items, {field: data for field in FIELDS}, fmt, pq_m=8)
+    store = VectorStore(str(tmp_path))
+    assert [seg["encoding"] for seg in store.segments] == [fmt]
+    queries = unit_rows(3, 3)
+    expected = queries @ store.vectors("vision").T
+    np.testing.assert_allclose(store.scores("vision", queries), expected, rtol=1e-3, atol=1e-3)
+    if fmt == "f16":
+        np.testing.assert_allclose(store.vectors("vision"), data, atol=1e-3)
+
+def test_writer_merges_and_replaces_paths(tmp_path):
+    store_dir = str(tmp_path)
+    w = VectorStoreWriter(store_dir)
+    add_rows(w, ["a", "b", "c"], 0)
+    w.close()
+
+    w = VectorStoreWriter(store_dir)
+    vis, _ = add_rows(w, ["b", "d"], 5)
+    w.close()
+
+    store = VectorStore(store_dir)
+    assert [it['path'] for it in store.items] == ["a", "c", "b", "d"]
+    np.testing.assert_allclose(store.vectors("vision", 2, 4), vis, atol=1e-3)
+    np.testing.assert_allclose(store.take("vision", [3, 0]), store.vectors("vision")[[3, 0]])
+
+def test_append_adds_segment_without_rewriting_old_one(tmp_path, small_pq):
+    store_dir = str(tmp_path)
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    first, _ = add_rows(w, [f"a{i}" for i in range(300)], 0)
+    w.close()
+    old = read_meta(store_dir)["segments"][0]
+    codes = np.load(os.path.join(store_dir, old["files"]["vision_codes"]))
+
+    for scan in range(4):
+        w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+        add_rows(w, [f"s{scan}-{i}" for i in range(50)], 10 + scan)
+        w.close()
+        meta = read_meta(store_dir)
+        assert meta["segments"][0] == old and meta["count"] == 350 + 50 * scan
+        store = VectorStore(store_dir)
+        np.testing.assert_array_equal(store.segments[0]["tables"]["vision_codes"], codes)
+        assert [it['path'] for it in store.items][-50:] == [f"s{scan}-{i}" for i in range(50)]
+        del store
+
+def test_pq_new_rows_use_existing_codebooks(tmp_path, small_pq):
+    store_dir = str(tmp_path)
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    add_rows(w, [f"a{i}" for i in range(300)], 0)
+    w.close()
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    vis, _ = add_rows(w, ["new"], 7)
+    w.close()
+    store = VectorStore(store_dir)
+    np.testing.assert_array_equal(store.segments[-1]["tables"]["vision_codes"], encode_pq(vis, store.books["vision"]))
+
+def test_small_first_write_then_large_append_trains_full_codebooks(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "PQ_MIN_ROWS", 512)
+    store_dir = str(tmp_path)
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    first = clustered_rows(3, 0)
+    for i, v in enumerate(first): w.add({'path': f"a{i}"}, v, v)
+    w.close()
+    assert read_meta(store_dir)["pq"] is None
+
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    rest = clustered_rows(2000, 1)
+    for i, v in enumerate(rest): w.add({'path': f"b{i}"}, v, v)
+    w.close()
+
+    pq = read_meta(store_dir)["pq"]
+    assert pq["ksub"] == 256 and pq["trained_rows"] == 2003
+    store = VectorStore(store_dir)
+    assert all(seg["encoding"] == "pq" for seg in store.segments)
+    data, decoded = np.concatenate([first, rest]), store.vectors("vision")
+    cos = (data * decoded).sum(1) / np.linalg.norm(decoded, axis=1)
+    assert cos.mean() > 0.9
+
+def test_pq_retrains_after_store_outgrows_training_set(tmp_path, small_pq):
+    store_dir = str(tmp_path)
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    add_rows(w, [f"a{i}" for i in range(300)], 0)
+    w.close()
+    books = read_meta(store_dir)["pq"]["books"]
+
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    add_rows(w, [f"b{i}" for i in range(500)], 1)
+    w.close()
+    assert read_meta(store_dir)["pq"]["books"] == books
+
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    add_rows(w, [f"c{i}" for i in range(400)], 2)
+    w.close()
+    pq = read_meta(store_dir)["pq"]
+    assert pq["books"] != books and pq["trained_rows"] == 1200
+
+def test_retrain_pq_changes_subspaces(tmp_path, small_pq):
+    store_dir = str(tmp_path)
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    add_rows(w, [f"a{i}" for i in range(300)], 0)
+    w.close()
+    retrain_pq(store_dir, pq_m=4)
+    store = VectorStore(store_dir)
+    assert len(store) == 300 and store.books["vision"].shape == (4, 256, DIM // 4)
+
+def test_format_switch_converts_store(tmp_path, small_pq):
+    store_dir = str(tmp_path)
+    w = VectorStoreWriter(store_dir, fmt="f16")
+    add_rows(w, [f"a{i}" for i in range(150)], 0)
+    w.close()
+    w = VectorStoreWriter(store_dir, fmt="pq", pq_m=8)
+    add_rows(w, ["b"], 1)
+    w.close()
+    store = VectorStore(store_dir)
+    assert store.format == "pq" and len(store) == 151
+    assert [seg["encoding"] for seg in store.segments] == ["pq", "pq"]
+
+def test_items_are_loaded_lazily(tmp_path):
+    store_dir = str(tmp_path)
+    w = VectorStoreWriter(store_dir)
+    add_rows(w, ["a", "b"], 0)
+    w.close()
+    store = VectorStore(store_dir)
+    assert len(store) == 2
+    store.scores("vision", unit_rows(1, 1))
+    assert store.items._cache == {}
+    assert store.items[-1]['path'] == "b"
+
+def test_reads_single_generation_store_and_migrates_it(tmp_path):
+    store_dir = str(tmp_path)
+    data = unit_rows(3, 0)
+    for field in FIELDS: np.save(os.path.join(store_dir, f"{field}-old.npy"), data.astype(np.float16))
+    meta = {"format": "f16", "dim": DIM, "count": 3, "items": [{'path': p} for p in "abc"],
+            "files": {field: f"{field}-old.npy" for field in FIELDS}}
+    with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as fh: json.dump(meta, fh)
+    assert [it['path'] for it in VectorStore(store_dir).items] == ["a", "b", "c"]
+
+    w = VectorStoreWriter(store_dir)
+    add_rows(w, ["b"], 1)
+    w.close()
+    store = VectorStore(store_dir)
+    assert [it['path'] for it in store.items] == ["a", "c", "b"]
+    np.testing.assert_allclose(store.vectors("vision", 0, 2), data[[0, 2]], atol=1e-3)
+    assert not os.path.exists(os.path.join(store_dir, "vision-old.npy"))
+
+def test_store_lock_excludes_second_writer(tmp_path):
+    acquired = threading.Event()
+    def second():
+        with StoreLock(str(tmp_path)): acquired.set()
+    with StoreLock(str(tmp_path)):
+        t = threading.Thread(target=second)
+        t.start()
+        time.sleep(0.2)
+        assert not acquired.is_set()
+    t.join(5)
+    assert acquired.is_set()
+
+def test_stale_files_are_removed_on_next_write(tmp_path, monkeypatch):
+    store_dir = str(tmp_path)
+    w = VectorStoreWriter(store_dir)
+    add_rows(w, ["a"], 0)
+    w.close()
+    first = set(os.listdir(store_dir))
+
+    # Simulate Windows refusing to delete files a reader still has mapped.
+    real_remove = os.remove
+    monkeypatch.setattr(os, "remove", lambda path: (_ for _ in ()).throw(PermissionError(path)))
+    w = VectorStoreWriter(store_dir)
+    add_rows(w, ["b"], 1)
+    w.close()
+    assert first <= set(os.listdir(store_dir))
+
+    monkeypatch.setattr(os, "remove", real_remove)
+    w = VectorStoreWriter(store_dir)
+    add_rows(w, ["c"], 2)
+    w.close()
+    referenced = vector_store._referenced(read_meta(store_dir))
+    assert set(os.listdir(store_dir)) - {"meta.json", ".lock"} == referenced
@@ -1,15 +1,22 @@
-import sys, os
+import sys, os, time
+import numpy as np
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLineEdit, QPushButton, QLabel, QScrollArea, 
-                             QTableWidget, QTableWidgetItem, QHeaderView, QFrame, 
+                             QTableView, QHeaderView, QFrame, 
                              QFileDialog, QStatusBar, QGridLayout, QMessageBox, 
-                             QStackedWidget, QSpinBox, QDoubleSpinBox, QComboBox, QProgressBar)
-from PySide6.QtCore import Qt, Signal
-from PySide6.QtGui import QPixmap, QColor
+                             QStackedWidget, QSpinBox, QDoubleSpinBox, QComboBox, QProgressBar, QCheckBox)
+from PySide6.QtCore import Qt, Signal, QTimer
+from PySide6.QtGui import QPixmap
 
-from engine.ai_worker import AIWorker, ModelLoader
-from ui.widgets import UniversalCard
+from engine.ai_worker import AIWorker, ModelLoader, QueryEncoder, ClusterWorker, engine_report
+from ui.widgets import UniversalCard, ResultsModel
 from engine.processor import collect_all_media
+from engine.vector_store import INDEX_PATH, VectorStore
+from engine.live_search import LiveIndex
+from engine.captioning import PRESET_KEYS
+
+# Live search re-lays out only this many gallery cards per keystroke.
+LIVE_GALLERY_TOP = 100
 
 # --- STYLESHEETS ---
 DARK_THEME = """
@@ -17,7 +24,7 @@ DARK_THEME = """
     QLineEdit { background-color: #1a1a1a; border: 1px solid #333; padding: 10px; color: #3d94ff; font-weight: bold; }
     QPushButton { background-color: #252525; border: 1px solid #333; padding: 8px; color: white; border-radius: 4px; }
     QPushButton:hover { background-color: #333; }
-    QTableWidget { background-color: #151515; border: 1px solid #333; color: #aaa; selection-background-color: #333; gridline-color: #222; }
+    QTableView { background-color: #151515; border: 1px solid #333; color: #aaa; selection-background-color: #333; gridline-color: #222; }
     QHeaderView::section { background-color: #222; border: 1px solid #333; padding: 4px; color: #eee; }
     QSpinBox, QDoubleSpinBox, QComboBox { background-color: #1a1a1a; border: 1px solid #444; padding: 5px; color: white; }
     QComboBox::drop-down { border: none; }
@@ -31,7 +38,7 @@ LIGHT_THEME = """
     QLineEdit { background-color: #ffffff; border: 1px solid #cccccc; padding: 10px; color: #005fb8; font-weight: bold; }
     QPushButton { background-color: #ffffff; border: 1px solid #cccccc; padding: 8px; color: #333; border-radius: 4px; }
     QPushButton:hover { background-color: #e6e6e6; }
-    QTableWidget { background-color: #ffffff; border: 1px solid #ddd; color: #333; selection-background-color: #d0e4f5; selection-color: #000; gridline-color: #eee; }
+    QTableView { background-color: #ffffff; border: 1px solid #ddd; color: #333; selection-background-color: #d0e4f5; selection-color: #000; gridline-color: #eee; }
     QHeaderView::section { background-color: #e0e0e0; border: 1px solid #ccc; padding: 4px; color: #000; }
     QSpinBox, QDoubleSpinBox, QComboBox { background-color: #ffffff; border: 1px solid #ccc; padding: 5px; color: #000; }
     QComboBox::drop-down { border: none; }
@@ -141,6 +148,14 @@ class MainWindow(QMainWindow):
         
         self._active_threads = []
         self.models_loaded = False
+        self.scan_active = False
+        self.scan_worker = None
+        self.live_index = None
+        self.live_rows = None       # table data row per live_index path
+        self.live_best_rows = None  # best store row per live_index path at the last re-rank
+        self.pending_gallery_order = None
+        self.gallery_order = []     # paths currently laid out in the gallery grid
+        self.gallery_limited = False
         
         self.setup_ui()
         self.setStyleSheet(DARK_THEME)
@@ -161,6 +176,15 @@ class MainWindow(QMainWindow):
         self.query_text = QLineEdit()
         self.query_text.setPlaceholderText("Describe object (e.g. 'Gray Cat')...")
         side_layout.addWidget(self.query_text)
+
+        self.chk_live = QCheckBox("Live search as you type (last scan)")
+        self.chk_live.setToolTip("Re-ranks already scanned files from cached captions/vectors. No new scan.")
+        side_layout.addWidget(self.chk_live)
+
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(200)
+        self.live_timer.timeout.connect(self.run_live_search)
         
         self.query_drop = SmartDropZone("Query Image", "#3d94ff", False)
         side_layout.addWidget(self.query_drop)
@@ -197,6 +221,17 @@ class MainWindow(QMainWindow):
         self.combo_mode.addItems(["Keyword Match (Precise)", "Vector Space (Abstract)"])
         self.combo_mode.currentIndexChanged.connect(self.on_mode_changed)
         side_layout.addWidget(self.combo_mode)
+
+        side_layout.addWidget(QLabel("Index Format:"))
+        self.combo_store = QComboBox()
+        self.combo_store.addItems(["Float16 (Exact)", "Product Quantized (Compact)"])
+        side_layout.addWidget(self.combo_store)
+
+        side_layout.addWidget(QLabel("Caption Preset:"))
+        self.combo_preset = QComboBox()
+        self.combo_preset.addItems(["Fast (Greedy)", "Balanced (3 Beams)", "Quality (Beam Size)"])
+        self.combo_preset.setCurrentIndex(2)
+        side_layout.addWidget(self.combo_preset)
         
         side_layout.addSpacing(5)
 
@@ -217,6 +252,10 @@ class MainWindow(QMainWindow):
         self.spin_rep_pen = QDoubleSpinBox(); self.spin_rep_pen.setRange(1.0, 2.0); self.spin_rep_pen.setValue(1.2); self.spin_rep_pen.setSingleStep(0.1)
         rp_layout.addWidget(self.spin_rep_pen); side_layout.addLayout(rp_layout)
 
+        self.chk_optimized = QCheckBox("Optimized Engine (compile + warmup)")
+        self.chk_optimized.setToolTip("Applied while the models load. Slower first start, faster scans.")
+        side_layout.addWidget(self.chk_optimized)
+
         side_layout.addStretch()
 
         # --- MODEL LOADER PROGRESS BAR ---
@@ -240,9 +279,12 @@ class MainWindow(QMainWindow):
         self.content_layout = QVBoxLayout(content)
         
         self.view_stack = QStackedWidget()
-        self.main_table = QTableWidget(0, 5)
-        self.main_table.setHorizontalHeaderLabels(["Filename", "Type", "Size", "Likelihood", "AI Prompt"])
+        self.results = ResultsModel()
+        self.main_table = QTableView()
+        self.main_table.setModel(self.results)
         self.main_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.main_table.verticalHeader().setDefaultSectionSize(24)
+        self.main_table.setSelectionBehavior(QTableView.SelectRows)
         self.view_stack.addWidget(self.main_table)
         
         self.main_scroll = QScrollArea()
@@ -260,6 +302,17 @@ class MainWindow(QMainWindow):
         bottom_bar.addWidget(self.lbl_status)
         bottom_bar.addStretch()
         
+        self.spin_group = QDoubleSpinBox(); self.spin_group.setRange(0.50, 0.99); self.spin_group.setValue(0.90); self.spin_group.setSingleStep(0.01)
+        self.spin_group.setFixedWidth(70)
+        self.spin_group.setToolTip("Similarity threshold for Group Similar (cosine of the vision embeddings).")
+        bottom_bar.addWidget(self.spin_group)
+
+        self.btn_group = QPushButton("🧩 Group Similar")
+        self.btn_group.setFixedWidth(140)
+        self.btn_group.setToolTip("Clusters the scanned files by visual similarity and groups the gallery cards.")
+        self.btn_group.clicked.connect(self.run_clustering)
+        bottom_bar.addWidget(self.btn_group)
+
         self.btn_theme = QPushButton("🌗 Theme")
         self.btn_theme.setFixedWidth(100)
         self.btn_theme.clicked.connect(self.toggle_theme)
@@ -285,10 +338,15 @@ class MainWindow(QMainWindow):
         self.target_drop.cleared.connect(self.wipe_data)
         self.target_drop.filesDropped.connect(self.add_files_to_view)
         self.scan_btn.clicked.connect(self.on_run_clicked)
+        self.query_text.textEdited.connect(self.on_query_edited)
         self.on_mode_changed()
 
     def on_run_clicked(self):
-        if self.models_loaded:
+        if self.scan_active and self.scan_worker:
+            self.scan_worker.stop()
+            self.scan_btn.setEnabled(False)
+            self.scan_btn.setText("STOPPING...")
+        elif self.models_loaded:
             self.start_live_scan()
         else:
             self.scan_btn.setEnabled(False)
@@ -296,18 +354,25 @@ class MainWindow(QMainWindow):
             self.loading_label.show()
             self.progress_loading.show()
             
-            loader = ModelLoader()
+            loader = ModelLoader(self.chk_optimized.isChecked())
             self._active_threads.append(loader) 
             loader.finished.connect(lambda: self.on_models_ready(loader))
             loader.start()
 
     def on_models_ready(self, loader):
         if loader in self._active_threads: self._active_threads.remove(loader)
-        self.models_loaded = True
         self.loading_label.hide()
         self.progress_loading.hide()
         self.scan_btn.setEnabled(True)
         self.scan_btn.setText("🚀 RUN GLOBAL AI SEARCH")
+        if loader.error:
+            QMessageBox.critical(self, "Error", f"Could not load the AI models:\n{loader.error}")
+            return
+        self.models_loaded = True
+        self.chk_optimized.setEnabled(False)
+        report = engine_report()
+        if report:
+            self.statusBar().showMessage(f"Optimized engine ({report['mode']}): {report['eager_ms']:.0f} ms -> {report['optimized_ms']:.0f} ms per item")
         self.start_live_scan()
 
     def toggle_theme(self):
@@ -325,6 +390,7 @@ class MainWindow(QMainWindow):
         self.target_drop.update_theme(self.is_dark_mode)
         for widgets in self.file_map.values():
             widgets['card'].update_theme(self.is_dark_mode)
+        self.results.set_theme(self.is_dark_mode)
 
     def on_mode_changed(self):
         is_keyword_mode = (self.combo_mode.currentIndex() == 0)
@@ -347,13 +413,19 @@ class MainWindow(QMainWindow):
         else: self.view_stack.setCurrentWidget(self.main_scroll)
         icon = "▦" if self.view_mode == "LIST" else "☷"
         self.btn_toggle_view.setText(f"Switch View {icon}")
+        if self.view_mode == "GALLERY" and self.pending_gallery_order:
+            self.relayout_gallery(*self.pending_gallery_order)
 
     def wipe_data(self):
-        self.main_table.setRowCount(0)
+        self.results.clear()
         while self.gallery_layout.count():
             item = self.gallery_layout.takeAt(0)
             if item.widget(): item.widget().deleteLater()
         self.file_map = {}
+        self.live_index = None
+        self.pending_gallery_order = None
+        self.gallery_order = []
+        self.gallery_limited = False
 
     def add_files_to_view(self, paths):
         files = collect_all_media(paths)
@@ -361,27 +433,21 @@ class MainWindow(QMainWindow):
         self.target_drop.all_paths.extend(new_files)
         self.target_drop.label.setText(f"{len(self.target_drop.all_paths)} files queued")
         
+        self.results.add_paths(new_files)
         for p in new_files:
-            row = self.main_table.rowCount()
-            self.main_table.insertRow(row)
-            self.main_table.setItem(row, 0, QTableWidgetItem(os.path.basename(p)))
-            self.main_table.setItem(row, 1, QTableWidgetItem(os.path.splitext(p)[1].upper()))
-            try: sz = f"{os.path.getsize(p)/(1024*1024):.1f} MB"
-            except: sz = "0 MB"
-            self.main_table.setItem(row, 2, QTableWidgetItem(sz))
-            self.main_table.setItem(row, 3, QTableWidgetItem("-"))
-            self.main_table.setItem(row, 4, QTableWidgetItem("-"))
-            
             card = UniversalCard(p)
             card.update_theme(self.is_dark_mode)
-            count = len(self.file_map)
+            count = len(self.gallery_order)
             self.gallery_layout.addWidget(card, count // 4, count % 4)
-            self.file_map[p] = {'row': row, 'card': card}
+            self.gallery_order.append(p)
+            self.file_map[p] = {'card': card}
+        if new_files: self.live_index = None
 
     def run_instant_caption(self, paths):
         if not paths: return
         self.statusBar().showMessage("AI interpreting query image...")
-        settings = {'num_beams': 5, 'min_length': 20, 'length_penalty': 2.0, 'repetition_penalty': 1.2, 'mode': 'vector'}
+        settings = {'num_beams': self.spin_beams.value(), 'min_length': self.spin_min_len.value(), 'length_penalty': self.spin_len_pen.value(),
+                    'repetition_penalty': self.spin_rep_pen.value(), 'mode': 'vector', 'preset': PRESET_KEYS[self.combo_preset.currentIndex()]}
         
         # FIX: Keep reference to the worker
         worker = AIWorker("", paths[0], [], settings)
@@ -406,28 +472,36 @@ class MainWindow(QMainWindow):
              QMessageBox.warning(self, "Error", "No target files selected!")
              return
         
-        for p, widgets in self.file_map.items():
-            self.main_table.setItem(widgets['row'], 3, QTableWidgetItem("Waiting..."))
-            self.main_table.setItem(widgets['row'], 4, QTableWidgetItem("-"))
-            for c in range(5):
-                self.main_table.item(widgets['row'], c).setBackground(QColor(0,0,0,0))
+        self.results.reset_results()
+        if self.gallery_limited: self.relayout_gallery(self.results.top_paths())
 
         settings = {
             'num_beams': self.spin_beams.value(),
             'min_length': self.spin_min_len.value(),
             'length_penalty': self.spin_len_pen.value(),
             'repetition_penalty': self.spin_rep_pen.value(),
-            'mode': mode
+            'mode': mode,
+            'preset': PRESET_KEYS[self.combo_preset.currentIndex()],
+            'store_dir': INDEX_PATH,
+            'store_format': "f16" if self.combo_store.currentIndex() == 0 else "pq"
         }
 
+        self.scan_active = True
         scan_worker = AIWorker(prompt, self.query_drop.all_paths[0] if self.query_drop.all_paths else None, targets, settings)
+        self.scan_worker = scan_worker
         self._active_threads.append(scan_worker)
+        self.scan_btn.setText("⏹ STOP SCAN")
         
         scan_worker.result_found.connect(self.update_single_item)
         scan_worker.progress_update.connect(self.handle_progress)
         
         def on_complete():
-            self.lbl_status.setText("Search Complete.")
+            self.lbl_status.setText("Search Stopped." if scan_worker.pool.stop_requested else "Search Complete.")
+            self.scan_active = False
+            self.scan_worker = None
+            self.scan_btn.setEnabled(True)
+            self.scan_btn.setText("🚀 RUN GLOBAL AI SEARCH")
+            self.live_index = None  # rebuilt from the updated store on the next live query
             if scan_worker in self._active_threads: self._active_threads.remove(scan_worker)
             
         scan_worker.finished.connect(on_complete)
@@ -438,28 +512,135 @@ class MainWindow(QMainWindow):
         for path, widgets in self.file_map.items():
             if os.path.basename(path) == message:
                 widgets['card'].set_processing()
-                color = QColor("#2a2a2a") if self.is_dark_mode else QColor("#e3f2fd")
-                for c in range(5):
-                    self.main_table.item(widgets['row'], c).setBackground(color)
+                self.results.set_processing(path)
 
     def update_single_item(self, data):
         path = data['path']
         if path in self.file_map:
             widgets = self.file_map[path]
             widgets['card'].set_result(data)
-            
-            score_val = f"{float(data['score']):.1%}"
-            self.main_table.setItem(widgets['row'], 3, QTableWidgetItem(score_val))
-            self.main_table.setItem(widgets['row'], 4, QTableWidgetItem(data['caption']))
-            
-            if float(data['score']) > 0.60:
-                highlight_col = QColor("#1b3320") if self.is_dark_mode else QColor("#e8f5e9")
-                text_col = QColor("#00e676") if self.is_dark_mode else QColor("#1b5e20")
-                for c in range(5):
-                    self.main_table.item(widgets['row'], c).setBackground(highlight_col)
-                self.main_table.item(widgets['row'], 3).setForeground(text_col)
-            else:
-                for c in range(5):
-                    self.main_table.item(widgets['row'], c).setBackground(QColor(0,0,0,0))
-                default_text = QColor("#aaa") if self.is_dark_mode else QColor("#333")
-                self.main_table.item(widgets['row'], 3).setForeground(default_text)
\ No newline at end of file
+            widgets['shown'] = (data['score'], data['caption'])
+            self.results.set_result(data)
+
+    # --- SIMILARITY GROUPS ---
+    def run_clustering(self):
+        if not VectorStore.exists(INDEX_PATH) or not self.file_map:
+            self.lbl_status.setText("Group Similar: run a scan first.")
+            return
+        self.btn_group.setEnabled(False)
+        self.lbl_status.setText("Grouping similar media...")
+        worker = ClusterWorker(INDEX_PATH, round(self.spin_group.value(), 2), list(self.file_map.keys()))
+        self._active_threads.append(worker)
+        worker.clusters_ready.connect(self.apply_clusters)
+        worker.finished.connect(lambda: self._active_threads.remove(worker) if worker in self._active_threads else None)
+        worker.start()
+
+    def apply_clusters(self, report):
+        self.btn_group.setEnabled(True)
+        if not report:
+            self.lbl_status.setText("Group Similar failed.")
+            return
+        order = []
+        for widgets in self.file_map.values(): widgets['card'].set_group(None, 0)
+        for cluster in report['clusters']:
+            for p in cluster['paths']:
+                if p in self.file_map:
+                    self.file_map[p]['card'].set_group(cluster['id'], cluster['size'])
+                    order.append(p)
+        grouped = set(order)
+        order += [p for p in self.file_map if p not in grouped]
+        if self.view_mode == "LIST": self.toggle_view()
+        self.relayout_gallery(order)
+        source = "from clusters.json" if report.get('cached') else f"{report['seconds']} s"
+        self.lbl_status.setText(f"{len(report['clusters'])} groups from {report['items']} items at {report['threshold']:.2f} ({source}).")
+
+    # --- LIVE SEARCH ---
+    def on_query_edited(self, text):
+        if self.chk_live.isChecked() and not self.scan_active:
+            self.live_timer.start()
+
+    def run_live_search(self):
+        text = self.query_text.text().strip()
+        if self.scan_active: return
+        if not text:
+            if self.gallery_limited: self.relayout_gallery(self.results.top_paths())
+            return
+        self.live_started = time.perf_counter()
+        if self.live_index is None:
+            try:
+                if VectorStore.exists(INDEX_PATH):
+                    self.live_index = LiveIndex(VectorStore(INDEX_PATH), self.file_map.keys())
+                    self.live_rows = self.results.rows_for(self.live_index.paths)
+                    self.live_best_rows = None
+            except Exception as e:
+                print(f"[LIVE SEARCH ERROR]: {e}")
+        if not self.live_index:
+            self.lbl_status.setText("Live search: run a scan first.")
+            return
+
+        if self.combo_mode.currentIndex() == 0:
+            self.apply_ranking(*self.live_index.rank_keyword(text))
+        elif self.models_loaded:
+            encoder = QueryEncoder(text)
+            self._active_threads.append(encoder)
+            encoder.encoded.connect(self.on_live_query_encoded)
+            encoder.finished.connect(lambda: self._active_threads.remove(encoder) if encoder in self._active_threads else None)
+            encoder.start()
+        else:
+            self.lbl_status.setText("Live search: models not loaded yet.")
+
+    def on_live_query_encoded(self, text, vec):
+        if text != self.query_text.text().strip() or not self.live_index: return  # stale keystroke
+        self.apply_ranking(*self.live_index.rank_vector(vec))
+
+    def apply_ranking(self, scores, best_rows):
+        """
+        Writes the live scores into the table model and reorders it by score. Captions are only
+        looked up for paths whose best row changed, and the gallery only lays out the top cards.
+        """
+        live = self.live_index
+        changed = np.arange(len(best_rows)) if self.live_best_rows is None else np.flatnonzero(best_rows != self.live_best_rows)
+        self.live_best_rows = best_rows
+        texts = {}
+        for g, r in zip(changed.tolist(), best_rows[changed].tolist()):
+            if self.live_rows[g] < 0: continue
+            item = live.items[r]
+            texts[int(self.live_rows[g])] = (item.get('caption', ""), item.get('timestamp', ""))
+        self.results.set_scores(self.live_rows, scores, texts)
+        self.results.sort_by_score()
+
+        order = self.results.top_paths(LIVE_GALLERY_TOP)
+        if self.view_mode == "GALLERY": self.relayout_gallery(order, limited=True)
+        else: self.pending_gallery_order = (order, True)
+        ms = (time.perf_counter() - self.live_started) * 1000
+        self.lbl_status.setText(f"Live: {len(scores)} cached items re-ranked in {ms:.0f} ms.")
+
+    def refresh_card(self, path):
+        """Shows the model's current result on a card, if it differs from what the card shows."""
+        widgets = self.file_map[path]
+        data = self.results.result(path)
+        if data and widgets.get('shown') != (data['score'], data['caption']):
+            widgets['card'].set_result(data)
+            widgets['shown'] = (data['score'], data['caption'])
+
+    def relayout_gallery(self, order, limited=False):
+        """
+        Lays the cards out in `order`. Only cards whose grid position changes are moved;
+        with limited=True the cards not in `order` are hidden (live search shows the top cards only).
+        """
+        self.pending_gallery_order = None
+        self.gallery_container.setUpdatesEnabled(False)
+        new_pos = {p: i for i, p in enumerate(order)}
+        old_pos = {p: i for i, p in enumerate(self.gallery_order)}
+        moved = [p for p in order if old_pos.get(p) != new_pos[p]]
+        gone = [p for p in self.gallery_order if p not in new_pos]
+        for p in moved + gone: self.gallery_layout.removeWidget(self.file_map[p]['card'])
+        for p in gone: self.file_map[p]['card'].hide()
+        for p in moved:
+            card = self.file_map[p]['card']
+            self.gallery_layout.addWidget(card, new_pos[p] // 4, new_pos[p] % 4)
+            if p not in old_pos: card.show()
+        for p in order: self.refresh_card(p)
+        self.gallery_order = list(order)
+        self.gallery_limited = limited
+        self.gallery_container.setUpdatesEnabled(True)
@@ -1,8 +1,13 @@
 import cv2
 import os
+import numpy as np
 from PySide6.QtWidgets import QFrame, QVBoxLayout, QLabel, QHBoxLayout
 from PySide6.QtGui import QPixmap, QImage, QColor
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+HIT_SCORE = 0.60
+# Qt enum attribute lookups cost microseconds each; ResultsModel.data() runs per visible cell and role.
+DISPLAY_ROLE, USER_ROLE, BACKGROUND_ROLE, FOREGROUND_ROLE = Qt.DisplayRole, Qt.UserRole, Qt.BackgroundRole, Qt.ForegroundRole
 
 def get_thumbnail(path):
     pix = QPixmap()
@@ -62,6 +67,10 @@ class UniversalCard(QFrame):
         self.caption_lbl.setWordWrap(True)
         self.caption_lbl.hide()
         self.meta_layout.addWidget(self.caption_lbl)
+
+        self.group_lbl = QLabel("")
+        self.group_lbl.hide()
+        self.meta_layout.addWidget(self.group_lbl)
         
         layout.addLayout(self.meta_layout)
         layout.addStretch()
@@ -82,7 +91,7 @@ class UniversalCard(QFrame):
         self.score = float(data['score'])
         
         # DEFINITION OF A HIT: > 60%
-        self.is_hit = self.score > 0.60
+        self.is_hit = self.score > HIT_SCORE
         
         timestamp = data.get('timestamp', "")
         score_text = f"🎯 {self.score:.1%}"
@@ -94,6 +103,14 @@ class UniversalCard(QFrame):
         
         self.apply_style()
 
+    def set_group(self, group_id, size):
+        """Shows which similarity cluster the card belongs to (None clears it)."""
+        if group_id is None:
+            self.group_lbl.hide()
+        else:
+            self.group_lbl.setText(f"🧩 Group {group_id + 1} • {size} similar")
+            self.group_lbl.show()
+
     def update_theme(self, is_dark_mode):
         """Called by MainWindow when toggling theme"""
         self.is_dark = is_dark_mode
@@ -134,4 +151,157 @@ class UniversalCard(QFrame):
         self.setStyleSheet(style)
         self.name_lbl.setStyleSheet(f"border: none; color: {text_main}; font-weight: bold;")
         self.status_lbl.setStyleSheet(f"border: none; color: {status_color}; font-size: 11px;")
-        self.caption_lbl.setStyleSheet(f"border: none; color: {text_sub}; font-style: italic; font-size: 11px;")
\ No newline at end of file
+        self.caption_lbl.setStyleSheet(f"border: none; color: {text_sub}; font-style: italic; font-size: 11px;")
+        self.group_lbl.setStyleSheet(f"border: none; color: {border_hit}; font-weight: bold; font-size: 11px;")
+
+class ResultsModel(QAbstractTableModel):
+    """
+    Table rows for the target files. Cells are built on demand in data(), so rescoring
+    only updates arrays and the view repaints just the rows it shows.
+    order maps view rows to data rows; sort_by_score() reorders without touching any cell.
+    """
+    HEADERS = ["Filename", "Type", "Size", "Likelihood", "AI Prompt"]
+
+    def __init__(self):
+        super().__init__()
+        self.is_dark = True
+        self._reset()
+
+    def _reset(self):
+        self.paths, self.types, self.sizes = [], [], []
+        self.captions, self.timestamps = [], []
+        self.scores = np.empty(0, np.float32)  # nan = not scored yet
+        self.status = {}                        # data row -> text shown instead of the score
+        self.processing = set()
+        self.row_of = {}                        # path -> data row
+        self.order = np.empty(0, np.int64)      # view row -> data row
+        self.view_row = np.empty(0, np.int64)   # data row -> view row
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=DISPLAY_ROLE):
+        if role == DISPLAY_ROLE and orientation == Qt.Horizontal: return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=DISPLAY_ROLE):
+        if role != DISPLAY_ROLE and role != BACKGROUND_ROLE and role != FOREGROUND_ROLE and role != USER_ROLE: return None
+        if not index.isValid(): return None
+        i, col = int(self.order[index.row()]), index.column()
+        score = float(self.scores[i])
+        if role == DISPLAY_ROLE:
+            if col == 0: return os.path.basename(self.paths[i])
+            if col == 1: return self.types[i]
+            if col == 2: return self.sizes[i]
+            if col == 3: return self.status.get(i) or ("-" if score != score else f"{score:.1%}")
+            return self.captions[i] or "-"
+        if role == USER_ROLE: return self.paths[i]
+        if role == BACKGROUND_ROLE:
+            if i in self.processing: return QColor("#2a2a2a") if self.is_dark else QColor("#e3f2fd")
+            if score > HIT_SCORE: return QColor("#1b3320") if self.is_dark else QColor("#e8f5e9")
+        elif col == 3 and score > HIT_SCORE and i not in self.status:
+            return QColor("#00e676") if self.is_dark else QColor("#1b5e20")
+        return None
+
+    def _rows_changed(self, data_row=None):
+        """One dataChanged signal for a data row, or for the whole table."""
+        if not len(self.paths): return
+        top = bottom = None if data_row is None else int(self.view_row[data_row])
+        if top is None: top, bottom = 0, len(self.paths) - 1
+        self.dataChanged.emit(self.index(top, 0), self.index(bottom, len(self.HEADERS) - 1))
+
+    def add_paths(self, paths):
+        if not paths: return
+        start = len(self.paths)
+        self.beginInsertRows(QModelIndex(), start, start + len(paths) - 1)
+        for p in paths:
+            self.row_of[p] = len(self.paths)
+            self.paths.append(p)
+            self.types.append(os.path.splitext(p)[1].upper())
+            try: sz = f"{os.path.getsize(p)/(1024*1024):.1f} MB"
+            except OSError: sz = "0 MB"
+            self.sizes.append(sz)
+            self.captions.append("")
+            self.timestamps.append("")
+        self.scores = np.concatenate([self.scores, np.full(len(paths), np.nan, np.float32)])
+        self.order = np.concatenate([self.order, np.arange(start, len(self.paths))])
+        self.view_row = np.concatenate([self.view_row, np.arange(start, len(self.paths))])
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._reset()
+        self.endResetModel()
+
+    def set_theme(self, is_dark):
+        self.is_dark = is_dark
+        self._rows_changed()
+
+    def reset_results(self):
+        """Marks every row as waiting for a new scan."""
+        self.scores[:] = np.nan
+        self.captions = [""] * len(self.paths)
+        self.timestamps = [""] * len(self.paths)
+        self.status = {i: "Waiting..." for i in range(len(self.paths))}
+        self.processing.clear()
+        self._rows_changed()
+
+    def set_processing(self, path):
+        i = self.row_of.get(path)
+        if i is None: return
+        self.processing.add(i)
+        self._rows_changed(i)
+
+    def set_result(self, data):
+        i = self.row_of.get(data['path'])
+        if i is None: return
+        self.scores[i] = float(data['score'])
+        self.captions[i] = data['caption']
+        self.timestamps[i] = data.get('timestamp', "")
+        self.status.pop(i, None)
+        self.processing.discard(i)
+        self._rows_changed(i)
+
+    def rows_for(self, paths):
+        """Data rows for paths (-1 where a path is not in the table)."""
+        return np.asarray([self.row_of.get(p, -1) for p in paths], dtype=np.int64)
+
+    def set_scores(self, rows, scores, texts):
+        """
+        Bulk rescoring for live search: scores[k] goes to data row rows[k] (rows < 0 are skipped),
+        texts maps data row -> (caption, timestamp) for the rows whose caption changed.
+        """
+        keep = rows >= 0
+        self.scores[rows[keep]] = scores[keep]
+        for i, (caption, timestamp) in texts.items():
+            self.captions[i], self.timestamps[i] = caption, timestamp
+        if self.status:
+            for i in rows[keep].tolist(): self.status.pop(i, None)
+
+    def sort_by_score(self):
+        """Reorders the view rows by descending score (unscored rows last) and repaints."""
+        self.layoutAboutToBeChanged.emit()
+        old_order = self.order
+        self.order = np.argsort(-np.nan_to_num(self.scores, nan=-np.inf), kind="stable")
+        self.view_row[self.order] = np.arange(len(self.order))
+        persistent = self.persistentIndexList()
+        if persistent:
+            self.changePersistentIndexList(persistent, [self.index(int(self.view_row[old_order[ix.row()]]), ix.column()) for ix in persistent])
+        self.layoutChanged.emit()
+        self._rows_changed()
+
+    def top_paths(self, n=None):
+        """Paths in view order (first n only if given)."""
+        rows = self.order if n is None else self.order[:n]
+        return [self.paths[i] for i in rows.tolist()]
+
+    def result(self, path):
+        """Card data for a scored path, or None."""
+        i = self.row_of.get(path)
+        if i is None or np.isnan(self.scores[i]): return None
+        data = {'path': path, 'score': float(self.scores[i]), 'caption': self.captions[i]}
+        if self.timestamps[i]: data['timestamp'] = self.timestamps[i]
+        return data